@@ -29,7 +29,8 @@ GEMINI_LLM_CONFIG = {
     "model_for_stock_qty_selection": os.getenv("GEMINI_MODEL", "gemini-2.5-pro"),
     "model_for_stock_selection": os.getenv("GEMINI_MODEL", "gemini-2.5-pro"),
     "temperature": 1,
-    "max_retries": 3
+    "max_retries": 3,
+    "prompt_cache_ttl_seconds": 3600  # Provider-side cache of system prompt + training PDF
 }
 
 # --- LLM Pricing ---
@@ -77,7 +78,12 @@ AGENT_CONFIG = {
     "RANDOM_SELECT_STOCKS" : False, # True for random selection, False to select TOP STOCKS COMPARED WITH AVAILABLE MARGIN
     "SELECT_STOCK_COUNT_TO_COMPARE" : 10,
     "NUMBER_OF_STOCKS_TO_TRADE" : 1,
-    "PREVIOUS_DECISIONS_TO_CONSIDER" : 5
+    "PREVIOUS_DECISIONS_TO_CONSIDER" : 5,
+    "MAX_PARALLEL_INSTRUMENTS" : 4, # Instruments processed concurrently per decision cycle (bounded for broker/LLM rate limits)
+    "LLM_DECISION_CACHE_TTL_SECONDS" : 300, # Reuse an LLM decision while its inputs are unchanged for up to this long
+    "DECISION_TRIGGER_BPS" : 30, # A streamed LTP move of this many basis points (market data streamer, instruments subscribed each cycle) triggers a decision before the interval
+    "UPSTOX_REQUESTS_PER_SECOND" : 10, # Sustained Upstox REST request rate across all decision workers
+    "UPSTOX_REQUEST_BURST" : 20
 }
 
 # --Techincal Instructions---
@@ -1,3 +1,4 @@
+import orjson
 from config import DATABASE_CONFIG
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
@@ -7,7 +8,13 @@ from sqlalchemy.orm import declarative_base, sessionmaker
 DATABASE_URL = f"postgresql+psycopg2://{DATABASE_CONFIG['user']}:{DATABASE_CONFIG['password']}@{DATABASE_CONFIG['host']}:{DATABASE_CONFIG['port']}/{DATABASE_CONFIG['database']}"
 
 # Engine and session
-engine = create_engine(DATABASE_URL, echo=False)
+# orjson for JSONB columns (LLM decisions); default=str keeps odd values from failing a save
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    json_serializer=lambda obj: orjson.dumps(obj, default=str).decode(),
+    json_deserializer=orjson.loads,
+)
 SessionLocal = sessionmaker(bind=engine)
 
 # Declarative base for all models
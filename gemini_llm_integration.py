@@ -1,7 +1,8 @@
 import os
-import json
+import orjson
 import re
 import mimetypes
+import threading
 from datetime import datetime
 from time import time
 from google import genai
@@ -10,7 +11,7 @@ from google.genai import types
 # Import your existing config and logger
 from config import INTRADAY_TECHNICAL_ANALYZER_CONFIG, LLM_PRICING, RISK_CONFIG, AGENT_CONFIG, GEMINI_LLM_CONFIG
 from logger_config import get_logger
-from prompts import SYSTEM_PROMPT_NEW_TRADE_EXECUTION, SYSTEM_PROMPT_POSITION_PRESENT, SYSTEM_PROMPT_STOCK_TO_TRADE
+from prompts import PROMPT_VERSION, SYSTEM_PROMPT_NEW_TRADE_EXECUTION, SYSTEM_PROMPT_POSITION_PRESENT, SYSTEM_PROMPT_STOCK_TO_TRADE
 
 logger = get_logger(__name__)
 JSON_REQ_RES_DIR = "llm_json_req_res"
@@ -39,15 +40,25 @@ class GeminiLLMClient:
         self.model_for_stock_selection = GEMINI_LLM_CONFIG['model_for_stock_selection']
         self.model_for_stock_qty_selection = GEMINI_LLM_CONFIG['model_for_stock_qty_selection']
         self.training_pdf_part = self._load_pdf_part("training/NSE_Training_Framework_for_AI_Models.pdf")   
+        # (model, system_prompt) -> (cached content name or None, refresh deadline)
+        self.prompt_cache_ttl = GEMINI_LLM_CONFIG.get('prompt_cache_ttl_seconds', 3600)
+        self._prompt_caches = {}
+        self._prompt_cache_lock = threading.Lock()
+        self._prompt_caches_creating = set() # keys whose caches.create call is in flight
         # self.training_video_part = self._load_video_part("https://youtu.be/jvzd7UPlb5Y?si=AVjpdE7dR0uhwPBE") 
                 
         os.makedirs(JSON_REQ_RES_DIR, exist_ok=True)
 
-    def _load_image_part(self, image_path: str):
+    def _load_image_part(self, image_path: str | bytes):
         """
-        Reads a local image and converts it into a GenAI Part object.
+        Reads a local image (or takes already-rendered PNG bytes) and converts it into a GenAI Part object.
         """
         try:
+            if isinstance(image_path, bytes):
+                return types.Part.from_bytes(data=image_path, mime_type="image/png")
+            if image_path is None:
+                logger.warning("No chart image was rendered.")
+                return None
             if not os.path.exists(image_path):
                 logger.warning(f"Image not found at: {image_path}")
                 return None
@@ -65,6 +76,10 @@ class GeminiLLMClient:
             logger.error(f"Error loading image part: {e}")
             return None
 
+    def _describe_image(self, image):
+        """Short log label for an image path or in-memory PNG."""
+        return f"<{len(image)} bytes PNG>" if isinstance(image, bytes) else image
+
     def _load_pdf_part(self, pdf_path: str):
         """
         Reads a local PDF and converts it into a GenAI Part object.
@@ -100,7 +115,71 @@ class GeminiLLMClient:
             logger.error(f"Error loading PDF part: {e}")
             return None
 
-    def generate_decision_for_new_trade(self, instrument_key: str, instrument_to_trade: str, market_data_str: str, market_intraday_data_str: str, portfolio_margin_status_str: str, portfolio_position_status_str: str, technical_summary: str, stock_news: str, previous_decision, number_of_instruments_to_trade, chart_plot_image_paths,all_positionss, leverage_on_intraday: int = 1) -> dict | None:
+    def _get_prompt_cache(self, model: str, system_prompt: str):
+        """
+        Returns the name of a Gemini cached-content entry holding the system prompt and
+        training PDF for this model, creating it on first use or once it is about to expire.
+        Returns None when caching is unavailable, so the caller sends everything inline.
+        """
+        cache_key = (model, system_prompt)
+        with self._prompt_cache_lock:
+            entry = self._prompt_caches.get(cache_key)
+            if entry and entry[1] > time():
+                return entry[0]
+            if cache_key in self._prompt_caches_creating:
+                # Another thread is creating it: don't wait on the network, use the entry being
+                # refreshed (still valid provider-side for about a minute) or send the prompt inline
+                return entry[0] if entry else None
+            self._prompt_caches_creating.add(cache_key)
+
+        # The create call runs outside the lock so other models/prompts are not blocked behind it
+        try:
+            cache = self.client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"sage_trade_prompt_{PROMPT_VERSION}",
+                    system_instruction=system_prompt,
+                    contents=[types.Content(role="user", parts=[self.training_pdf_part])],
+                    ttl=f"{self.prompt_cache_ttl}s",
+                ),
+            )
+            cache_name = cache.name
+            logger.info(f"Created prompt cache {cache_name} for model {model}")
+        except Exception as e:
+            # Also remembered for one TTL so a model without caching support isn't retried every call
+            logger.warning(f"Prompt caching unavailable for model {model}, sending system prompt inline: {e}")
+            cache_name = None
+
+        with self._prompt_cache_lock:
+            # Refresh a minute before the provider-side entry expires
+            self._prompt_caches[cache_key] = (cache_name, time() + self.prompt_cache_ttl - 60)
+            self._prompt_caches_creating.discard(cache_key)
+        return cache_name
+
+    def _build_json_config(self, model: str, system_prompt: str):
+        """
+        Builds the GenerateContentConfig for a JSON decision call.
+
+        Returns the config and the static parts (training PDF) that still have to be
+        sent inline, which is none when the prompt prefix is served from the cache.
+        """
+        cache_name = self._get_prompt_cache(model, system_prompt)
+        if cache_name:
+            config = types.GenerateContentConfig(
+                temperature=self.temperature,
+                response_mime_type="application/json",
+                cached_content=cache_name
+            )
+            return config, []
+
+        config = types.GenerateContentConfig(
+            temperature=self.temperature,
+            response_mime_type="application/json",
+            system_instruction=[types.Part.from_text(text=system_prompt)]
+        )
+        return config, [self.training_pdf_part]
+
+    def generate_decision_for_new_trade(self, instrument_key: str, instrument_to_trade: str, market_data_str: str, market_intraday_data_str: str, portfolio_margin_status_str: str, portfolio_position_status_str: str, technical_summary: str, stock_news: str, previous_decision, number_of_instruments_to_trade, chart_plot_image_paths,all_positionss, leverage_on_intraday: int = 1, transaction_charges: str = "N/A") -> dict | None:
         """
         Sends the current market and portfolio data to the LLM and gets a trading decision.
         """
@@ -114,6 +193,7 @@ class GeminiLLMClient:
         * Risk_Percentage: {RISK_CONFIG["RISK_PERCENTAGE_FOR_SINGLE_TRADE"]}%
         * Portfolio Margin: {portfolio_margin_status_str}
         * All Positions: {all_positionss}
+        * Transaction Charges: {transaction_charges}
 
         **Time Context:**
         * Current Time: {datetime.now().strftime("%H:%M:%S")} IST
@@ -169,7 +249,7 @@ class GeminiLLMClient:
         logger.info("================Generating LLM decision======================")
         image_parts =[]
         for chart_plot_image_path in chart_plot_image_paths:
-            logger.info(f"Attaching chart image for LLM: {chart_plot_image_path}")
+            logger.info(f"Attaching chart image for LLM: {self._describe_image(chart_plot_image_path)}")
             image_part = self._load_image_part(chart_plot_image_path)
             if not image_part:
                 logger.error("Skipping decision generation due to missing image.")
@@ -178,35 +258,31 @@ class GeminiLLMClient:
 
 
         try:
+            # System prompt and training PDF come from the prompt cache when available
+            config, static_parts = self._build_json_config(self.model_for_stock_qty_selection, SYSTEM_PROMPT_NEW_TRADE_EXECUTION)
+
             # FIX: 'system' role is removed from here
             contents = [
                 types.Content(role="user", parts=[types.Part.from_text(text=user_data_prompt)]),
                 types.Content(role="model", parts=[types.Part.from_text(text="I understand. I'll analyze the data and provide a trading decision in the specified JSON format.")]),
                 types.Content(role="user", parts=[
                     types.Part.from_text(text=user_question_prompt),
-                    self.training_pdf_part,
+                    *static_parts,
                     *image_parts
                 ])
             ]
 
-            # FIX: System prompt goes here
-            config = types.GenerateContentConfig(
-                temperature=self.temperature,
-                response_mime_type="application/json",
-                system_instruction=[types.Part.from_text(text=SYSTEM_PROMPT_NEW_TRADE_EXECUTION)]
-            )
-
             response = self._generate_content_wrapper(self.model_for_stock_qty_selection, contents, config)
             
             decision_str = response.text
             logger.info(f"***************LLM DECISION***************: \n{decision_str}")
             
-            decision_json = json.loads(decision_str)
+            decision_json = orjson.loads(decision_str)
 
             usage = response.usage_metadata
             if usage:
                 cost = self.calculate_cost(self.model_for_stock_qty_selection, usage)
-                logger.info(f"====Cost Breakdown====\n{json.dumps(cost)}")
+                logger.info(f"====Cost Breakdown====\n{orjson.dumps(cost).decode()}")
                 decision_json["cost_info"] = cost
 
             json_to_save = {
@@ -217,14 +293,14 @@ class GeminiLLMClient:
 
             return json_to_save
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to decode LLM JSON response: {e}")
             return None
         except Exception as e:
             logger.error(f"An error occurred while communicating with the LLM: {e}")
             return None
         
-    def generate_decision_for_position_present(self, instrument_key: str, instrument_to_trade: str, market_data_str: str, market_intraday_data_str: str, portfolio_margin_status_str: str, portfolio_position_status_str: str, technical_summary: str, stock_news: str, previous_decision, number_of_instruments_to_trade, chart_plot_image_paths,all_position, leverage_on_intraday: int = 1) -> dict | None:
+    def generate_decision_for_position_present(self, instrument_key: str, instrument_to_trade: str, market_data_str: str, market_intraday_data_str: str, portfolio_margin_status_str: str, portfolio_position_status_str: str, technical_summary: str, stock_news: str, previous_decision, number_of_instruments_to_trade, chart_plot_image_paths,all_position, leverage_on_intraday: int = 1, transaction_charges: str = "N/A") -> dict | None:
         """
         Sends the current market and portfolio data to the LLM for an existing position.
         """
@@ -236,6 +312,7 @@ class GeminiLLMClient:
         * **Number of Intruments to Trade Today (Max):** {number_of_instruments_to_trade}
         * **Leverage on Intraday:** {AGENT_CONFIG["LEVERAGE_ON_INTRADAY"]}x
         * **Risk Percentage per Trade:** {RISK_CONFIG["RISK_PERCENTAGE_FOR_SINGLE_TRADE"]}%
+        * **Transaction Charges:** {transaction_charges}
         
         ---
         ### ⏰ TIME CONTEXT
@@ -298,7 +375,7 @@ class GeminiLLMClient:
 
         image_parts =[]
         for chart_plot_image_path in chart_plot_image_paths:
-            logger.info(f"Attaching chart image for LLM: {chart_plot_image_path}")
+            logger.info(f"Attaching chart image for LLM: {self._describe_image(chart_plot_image_path)}")
             image_part = self._load_image_part(chart_plot_image_path)
             if not image_part:
                 logger.error("Skipping decision generation due to missing image.")
@@ -308,28 +385,24 @@ class GeminiLLMClient:
         logger.info("================Generating LLM decision for existing position======================")
         
         try:
+            # System prompt and training PDF come from the prompt cache when available
+            config, static_parts = self._build_json_config(self.model, SYSTEM_PROMPT_POSITION_PRESENT)
+
             contents = [
                 types.Content(role="user", parts=[types.Part.from_text(text=user_data_prompt)]),
                 types.Content(role="model", parts=[types.Part.from_text(text="I acknowledge the existing position context, previous decisions, and all financial data. I will analyze P&L, exposure, technicals, and time constraints to generate a management decision in strict JSON format.")]),
                 types.Content(role="user", parts=[
                     types.Part.from_text(text=user_question_prompt),
-                    self.training_pdf_part,
+                    *static_parts,
                     *image_parts
                 ])
             ]
 
-            # FIX: System prompt added to config
-            config = types.GenerateContentConfig(
-                temperature=self.temperature,
-                response_mime_type="application/json",
-                system_instruction=[types.Part.from_text(text=SYSTEM_PROMPT_POSITION_PRESENT)]
-            )
-
             response = self._generate_content_wrapper(self.model, contents, config)
             decision_str = response.text
             logger.info(f"***************LLM DECISION FOR EXISTING POSITION***************: \n{decision_str}")
 
-            decision_json = json.loads(decision_str)
+            decision_json = orjson.loads(decision_str)
 
             usage = response.usage_metadata
             if usage:
@@ -364,6 +437,9 @@ class GeminiLLMClient:
         """
         
         try:
+            # System prompt and training PDF come from the prompt cache when available
+            config, static_parts = self._build_json_config(self.model_for_stock_selection, SYSTEM_PROMPT_STOCK_TO_TRADE)
+
             user_parts = [types.Part.from_text(text=intro_prompt)]
             
             for technical_summary in technical_summaries:
@@ -374,30 +450,23 @@ class GeminiLLMClient:
                 logger.info(f"Attaching chart image for LLM: {technical_summary['chart_plot_image_path']}")
                 if img_part:
                     user_parts.append(img_part)
-            user_parts.append(self.training_pdf_part)
+            user_parts.extend(static_parts)
             # FIX: 'system' role removed from contents
             contents = [
                 types.Content(role="user", parts=user_parts)
             ]
 
-            # FIX: System prompt added to config
-            config = types.GenerateContentConfig(
-                temperature=self.temperature,
-                response_mime_type="application/json",
-                system_instruction=[types.Part.from_text(text=SYSTEM_PROMPT_STOCK_TO_TRADE)]
-            )
-
             response = self._generate_content_wrapper(self.model_for_stock_selection, contents, config)
             
             decision_str = response.text
             logger.info(f"***************STOCK TO TRADE*************** \n{decision_str}")
 
-            decision_json = json.loads(decision_str)
+            decision_json = orjson.loads(decision_str)
 
             usage = response.usage_metadata
             if usage:
                 cost = self.calculate_cost(self.model_for_stock_selection, usage)
-                logger.info(f"====Cost Breakdown====\n{json.dumps(cost)}")
+                logger.info(f"====Cost Breakdown====\n{orjson.dumps(cost).decode()}")
                 decision_json["cost_info"] = cost
 
             self.create_json_file({"response": decision_json})
@@ -438,7 +507,7 @@ class GeminiLLMClient:
             logger.info(f"===== LLM Image Analysis Response =====\n{result_text}")
             logger.info(f"===== LLM response.usage_metadata =====\n{response.usage_metadata}")
             cost = self.calculate_cost(self.model_for_stock_qty_selection, response.usage_metadata)
-            logger.info(f"====Cost Breakdown====\n{json.dumps(cost)}")
+            logger.info(f"====Cost Breakdown====\n{orjson.dumps(cost).decode()}")
             self.create_json_file({"response": result_text})
             return result_text
 
@@ -464,14 +533,14 @@ class GeminiLLMClient:
             decision_str = response.text
             logger.info(f"***************LLM RESPONSE ({file_prefix})***************: \n{decision_str}")
             
-            decision_json = json.loads(decision_str)
+            decision_json = orjson.loads(decision_str)
 
             # Cost Calculation
             usage = response.usage_metadata
             cost = {}
             if usage:
                 cost = self.calculate_cost(model, usage)
-                logger.info(f"====Cost Breakdown====\n{json.dumps(cost)}")
+                logger.info(f"====Cost Breakdown====\n{orjson.dumps(cost).decode()}")
                 decision_json["cost_info"] = cost
 
             serialized_request = []
@@ -492,7 +561,7 @@ class GeminiLLMClient:
             self.create_json_file(json_to_save, file_prefix)
             return json_to_save
 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to decode LLM JSON response: {e}")
             return None
         except Exception as e:
@@ -556,8 +625,8 @@ class GeminiLLMClient:
             json_file_name = f"{timestamp}_{safe_prefix}.json"
             json_file_path = os.path.join(JSON_REQ_RES_DIR, json_file_name)
     
-            with open(json_file_path, "w", encoding="utf-8") as json_file:
-                json.dump(body, json_file, ensure_ascii=False, indent=2)
+            with open(json_file_path, "wb") as json_file:
+                json_file.write(orjson.dumps(body, option=orjson.OPT_INDENT_2))
     
         except Exception as e:
             logger.error(f"Failed to create JSON Prompt file: {e}")
@@ -520,6 +520,19 @@ class IntradayAnalyzer:
         logger.info(f"Generated intraday news for {self.symbol}: {news}")
         return news
 
+    def refresh(self):
+        """
+        Re-fetch the latest bars so a pooled analyzer can be reused for the next cycle.
+        Keeps the instance (and its NSE session) instead of building a new analyzer per call.
+        Returns None (and leaves self.data as None) when the fetch fails, so stale bars are never reused.
+        """
+        self.data = None
+        self.signals = []
+        self.indicators_calculated = False
+        if self.fetch_intraday_data() is None:
+            self.data = None
+        return self.data
+
     def cleanup(self):
         """Cleanup resources"""
         self.data = None
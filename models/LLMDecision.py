@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, func
+from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, Index, func
 from sqlalchemy.dialects.postgresql import JSONB
 from pydantic import BaseModel
 from typing import Optional
@@ -11,6 +11,10 @@ class LLMDecision(Base):
     ORM Model to store LLM trading decisions.
     """
     __tablename__ = "llm_decision"
+    __table_args__ = (
+        # Serves get_today_decisions_for_instrument: instrument_key = ? AND created_on >= CURRENT_DATE
+        Index("idx_llm_decision_instrument_created_on", "instrument_key", "created_on"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     created_on = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from newsapi import NewsApiClient
 from datetime import datetime, timedelta
 
@@ -61,6 +62,28 @@ class NewsFetcher:
             logger.info(f"❌ Error fetching news: {e}")
             return []
 
+    def get_company_news_batch(self, queries: list, max_workers: int = 8, **kwargs):
+        """
+        Fetch news for several companies concurrently.
+
+        NewsAPI has no per-symbol multi-query (an OR query shares one page of
+        results across all companies), so requests are fanned out instead.
+
+        Args:
+            queries (list): Company or stock names.
+            max_workers (int): Maximum concurrent NewsAPI requests.
+            **kwargs: Passed through to get_company_news.
+
+        Returns:
+            dict: query -> list of articles as returned by get_company_news.
+        """
+        unique_queries = list(dict.fromkeys(queries))
+        if not unique_queries:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_queries)), thread_name_prefix="news") as executor:
+            results = executor.map(lambda query: self.get_company_news(query, **kwargs), unique_queries)
+            return dict(zip(unique_queries, results))
+
     def get_top_headlines(self, category: str = 'business', country: str = 'in'):
         """
         Fetch top business headlines (default India).
@@ -3,7 +3,7 @@ import requests
 from io import StringIO
 import time
 import yfinance as yf
-from datetime import datetime
+from datetime import date, datetime
 
 class NSE500Fetcher:
     """
@@ -27,6 +27,9 @@ class NSE500Fetcher:
             'Connection': 'keep-alive',
         }
         self.stock_list = None
+        self.stock_list_fetched_on = None # Index constituents change at most daily
+        self._instrument_csv = None # Comma-joined instrument keys, built once per fetched stock_list
+        self._instrument_csv_source = None
 
     def fetch_df(self):
         """
@@ -61,8 +64,11 @@ class NSE500Fetcher:
             return None
         
     def fetch_stock_list(self):
-        if self.stock_list is None:
+        if self.stock_list is None or self.stock_list_fetched_on != date.today():
             df = self.fetch_df()
+            if df is None:
+                # Keep serving yesterday's list rather than failing the caller
+                return self.stock_list
             # Rename specific columns
             rename_map = {
                 'Company_Name': 'company_name',
@@ -77,9 +83,9 @@ class NSE500Fetcher:
             # Convert DataFrame to list of dicts
             stock_list = df.to_dict(orient='records')
             self.stock_list = stock_list
+            self.stock_list_fetched_on = date.today()
             print(f"Successfully fetched {len(stock_list)} stocks for NIFTY 500.")
-            return stock_list
-        return stock_list
+        return self.stock_list
 
 
     def get_symbols_(self):
@@ -116,12 +122,22 @@ class NSE500Fetcher:
             list or None: List of stock symbols (strings), or None if data 
                           wasn't fetched.
         """
-        if self.stock_list is None:
-            self.fetch_stock_list()
+        self.fetch_stock_list()
         
         instruments = ["NSE_EQ|"+stock['insin_code'] for stock in self.stock_list]
         return instruments
 
+    def get_instrument_list_csv(self, limit=499):
+        """
+        Returns the first `limit` instrument keys comma-joined for the LTP API.
+        The string is rebuilt only when the stock list itself is refetched.
+        """
+        self.fetch_stock_list()
+        if self._instrument_csv_source is not self.stock_list:
+            self._instrument_csv = ",".join(self.get_instrument_list()[:limit])
+            self._instrument_csv_source = self.stock_list
+        return self._instrument_csv
+
 
     def fetch_stock_data(self, symbols, batch_size=50):
         """Fetch comprehensive data using Tickers in batches"""
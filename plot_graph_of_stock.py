@@ -1,5 +1,8 @@
 import matplotlib
 matplotlib.use('Agg')  # <-- ADD THIS LINE FIRST
+import matplotlib.pyplot as plt
+# Figures are closed explicitly after every render, so the open-figure warning is noise
+plt.rcParams['figure.max_open_warning'] = 0
 
 import yfinance as yf
 import mplfinance as mpf
@@ -8,6 +11,23 @@ import pandas as pd
 import pytz 
 import pandas_ta as ta
 import os
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+INDICATOR_CACHE_DIR = 'charts/.cache'
+# Indicator cache files older than this, or beyond the newest INDICATOR_CACHE_MAX_FILES, are deleted on write
+INDICATOR_CACHE_TTL_SECONDS = 24 * 60 * 60
+INDICATOR_CACHE_MAX_FILES = 500
+# matplotlib's pyplot state machine is not thread-safe; charts may be rendered from worker threads
+_PLOT_LOCK = threading.Lock()
+# Rendered PNGs keyed by last-bar key, so an unchanged chart is not re-rendered (LRU)
+CHART_BYTES_CACHE_SIZE = 64
+_CHART_BYTES_CACHE = OrderedDict()
+_CHART_BYTES_CACHE_LOCK = threading.Lock()
+
 class StockChartAnalyzer:
     """A class to fetch, analyze, and plot stock data with technical indicators."""
     
@@ -28,6 +48,8 @@ class StockChartAnalyzer:
         self.data_clean = None
         self.file_name = f'charts/{self.ticker}_{self.interval}_{self.days}D_chart.png'
         self.chart_title = None
+        self._st_col = None
+        self.chart_bytes = None
         
     
     def fetch_data(self):
@@ -39,8 +61,8 @@ class StockChartAnalyzer:
         """
 
         try:
-            self.data = yf.download(
-                self.ticker,
+            # Ticker.history is safe to call from several threads; yf.download shares global state
+            self.data = yf.Ticker(self.ticker).history(
                 period=self.days,
                 interval=self.interval,
                 prepost=False,
@@ -62,15 +84,10 @@ class StockChartAnalyzer:
             print("🛑 ERROR: No data available for column normalization.")
             return False
             
-        new_columns = []
-        for col in self.data.columns:
-            if isinstance(col, tuple):
-                new_col_name = str(col[0]).capitalize()
-            else:
-                new_col_name = str(col).capitalize()
-            new_columns.append(new_col_name)
-        
-        self.data.columns = new_columns
+        # Ticker.history returns flat columns; a (field, ticker) MultiIndex is still reduced to its field level defensively
+        cols = self.data.columns
+        first_level = cols.get_level_values(0) if isinstance(cols, pd.MultiIndex) else cols
+        self.data.columns = first_level.astype(str).str.capitalize()
         
         # Check for required columns
         missing_cols = [col for col in self.ohlcv_cols if col not in self.data.columns]
@@ -128,25 +145,38 @@ class StockChartAnalyzer:
         if self.data_clean is None:
             print("🛑 ERROR: No cleaned data available for indicator calculation.")
             return False
+
+        cache_path = self._indicator_cache_path()
+        if os.path.exists(cache_path):
+            try:
+                self.data_clean = pd.read_parquet(cache_path)
+                self._st_col = next(col for col in self.data_clean.columns if col.startswith('SUPERT_'))
+                print(f"✅ Indicators loaded from cache: {cache_path}")
+                return True
+            except Exception as e:
+                print(f"⚠️ Warning: Failed to read indicator cache, recalculating. Error: {e}")
             
         try:
+            # New columns are collected first and joined once at the end,
+            # instead of inserting them one by one into a growing DataFrame
+            new_cols = {}
+
             # SuperTrend
-            st = self.data_clean.ta.supertrend(length=10, multiplier=3, append=True)
-            st_main_col = [col for col in st.columns if col.startswith('SUPERT_')][0]
-            self.data_clean[st_main_col] = st[st_main_col]
+            st = self.data_clean.ta.supertrend(length=10, multiplier=3)
+            self._st_col = next(col for col in st.columns if col.startswith('SUPERT_'))
             
             # RSI
-            self.data_clean['RSI'] = ta.rsi(self.data_clean['Close'], length=14)
+            new_cols['RSI'] = ta.rsi(self.data_clean['Close'], length=14)
             
             # Moving Averages
-            self.data_clean['SMA_20'] = self.data_clean.ta.sma(20)
-            self.data_clean['SMA_50'] = self.data_clean.ta.sma(50)
+            new_cols['SMA_20'] = self.data_clean.ta.sma(20)
+            new_cols['SMA_50'] = self.data_clean.ta.sma(50)
             
             # --- NEW: VWAP ---
             # VWAP calculation needs 'High', 'Low', 'Close', 'Volume'
             # Note: VWAP for yfinance intraday data can be cumulative from start of history, 
             # for true daily VWAP, the function ta.vwap() resets daily (which is preferred for intraday)
-            self.data_clean['VWAP'] = ta.vwap(
+            new_cols['VWAP'] = ta.vwap(
                 high=self.data_clean['High'], 
                 low=self.data_clean['Low'], 
                 close=self.data_clean['Close'], 
@@ -154,26 +184,77 @@ class StockChartAnalyzer:
             )
             
             # --- NEW: EMAs (9 and 21) ---
-            self.data_clean['EMA_9'] = self.data_clean.ta.ema(9)
-            self.data_clean['EMA_21'] = self.data_clean.ta.ema(21)
+            new_cols['EMA_9'] = self.data_clean.ta.ema(9)
+            new_cols['EMA_21'] = self.data_clean.ta.ema(21)
             
             # --- NEW: MACD ---
             # Default settings are: fast=12, slow=26, signal=9
-            macd_df = self.data_clean.ta.macd(fast=12, slow=26, signal=9, append=True)
+            macd_df = self.data_clean.ta.macd(fast=12, slow=26, signal=9)
             
             # The columns created are typically MACD_12_26_9, MACDh_12_26_9, MACDs_12_26_9
             # We'll rename them for easier use:
-            self.data_clean['MACD_Line'] = macd_df.iloc[:, 0]
-            self.data_clean['MACD_Hist'] = macd_df.iloc[:, 1]
-            self.data_clean['MACD_Signal'] = macd_df.iloc[:, 2]
+            new_cols['MACD_Line'] = macd_df.iloc[:, 0]
+            new_cols['MACD_Hist'] = macd_df.iloc[:, 1]
+            new_cols['MACD_Signal'] = macd_df.iloc[:, 2]
+
+            # Single block join (keeps the raw SuperTrend/MACD columns append=True used to add)
+            self.data_clean = pd.concat(
+                [self.data_clean, st, macd_df, pd.DataFrame(new_cols, index=self.data_clean.index)],
+                axis=1
+            )
 
             print(f"✅ Indicators calculated. Final columns: {list(self.data_clean.columns)}")
+            self._write_indicator_cache(cache_path)
             return True
             
         except Exception as e:
             print(f"🛑 ERROR: Failed to calculate indicators: {e}")
             return False
     
+    def _last_bar_key(self):
+        """
+        Build a cache key for the current cleaned data.
+
+        The key includes the last bar's timestamp and OHLCV values, so a new bar or an
+        update to the still-forming bar yields a new key and the indicators are recomputed.
+        """
+        last_bar = self.data_clean.iloc[-1]
+        last_values = ",".join(str(last_bar[col]) for col in self.ohlcv_cols)
+        raw_key = f"{self.ticker}{self.interval}{self.days}{self.data_clean.index[-1].isoformat()}{last_values}"
+        return hashlib.md5(raw_key.encode()).hexdigest()
+
+    def _indicator_cache_path(self):
+        """Build the cache file path for the current cleaned data."""
+        return os.path.join(INDICATOR_CACHE_DIR, f"ind_{self._last_bar_key()}.parquet")
+
+    def _write_indicator_cache(self, cache_path):
+        """Persist the post-indicator DataFrame so repeated renders skip recalculation."""
+        try:
+            os.makedirs(INDICATOR_CACHE_DIR, exist_ok=True)
+            self.data_clean.to_parquet(cache_path)
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to write indicator cache. Error: {e}")
+        self._prune_indicator_cache()
+
+    @staticmethod
+    def _prune_indicator_cache():
+        """Delete indicator cache files past the TTL, then the oldest beyond INDICATOR_CACHE_MAX_FILES."""
+        entries = []
+        try:
+            for entry in os.scandir(INDICATOR_CACHE_DIR):
+                if entry.name.endswith('.parquet'):
+                    entries.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            return # Directory missing, or a file removed by another worker mid-scan; prune next time
+        entries.sort(reverse=True)
+        cutoff = time.time() - INDICATOR_CACHE_TTL_SECONDS
+        for index, (mtime, path) in enumerate(entries):
+            if index >= INDICATOR_CACHE_MAX_FILES or mtime < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass # Already removed by another worker
+
     def create_addplots(self):
         """
         Create additional plots for technical indicators.
@@ -186,21 +267,25 @@ class StockChartAnalyzer:
             return []
             
         try:
-            # Find SuperTrend column
-            st_main_col = [col for col in self.data_clean.columns if col.startswith('SUPERT_')][0]
+            # SuperTrend column is resolved once in calculate_indicators
+            st_main_col = self._st_col
             
             # --- Get last values for labels ---
-            # (We use .iloc[-1] to get the last row's value)
-            last_st = self.data_clean[st_main_col].iloc[-1]
-            last_sma_20 = self.data_clean['SMA_20'].iloc[-1]
-            last_sma_50 = self.data_clean['SMA_50'].iloc[-1]
-            last_vwap = self.data_clean['VWAP'].iloc[-1]
-            last_ema_9 = self.data_clean['EMA_9'].iloc[-1]
-            last_ema_21 = self.data_clean['EMA_21'].iloc[-1]
-            last_rsi = self.data_clean['RSI'].iloc[-1]
-            last_macd_line = self.data_clean['MACD_Line'].iloc[-1]
-            last_macd_signal = self.data_clean['MACD_Signal'].iloc[-1]
-            last_macd_hist = self.data_clean['MACD_Hist'].iloc[-1]
+            # (One row grab for all labelled series instead of one .iloc[-1] per column)
+            last = self.data_clean[[
+                st_main_col, 'SMA_20', 'SMA_50', 'VWAP', 'EMA_9', 'EMA_21',
+                'RSI', 'MACD_Line', 'MACD_Signal', 'MACD_Hist'
+            ]].iloc[-1].to_dict()
+            last_st = last[st_main_col]
+            last_sma_20 = last['SMA_20']
+            last_sma_50 = last['SMA_50']
+            last_vwap = last['VWAP']
+            last_ema_9 = last['EMA_9']
+            last_ema_21 = last['EMA_21']
+            last_rsi = last['RSI']
+            last_macd_line = last['MACD_Line']
+            last_macd_signal = last['MACD_Signal']
+            last_macd_hist = last['MACD_Hist']
 
             # 1. Calculate the difference (change) between the current and previous bar
             hist_diff = self.data_clean['MACD_Hist'].diff()
@@ -310,7 +395,8 @@ class StockChartAnalyzer:
         Generate and save the candlestick chart with indicators.
         
         Args:
-            save_file (bool): Whether to save the chart to file
+            save_file (bool): Whether to save the chart to file; if False the PNG is
+                kept in memory in self.chart_bytes instead
             
         Returns:
             bool: True if successful, False otherwise
@@ -319,6 +405,7 @@ class StockChartAnalyzer:
             print("🛑 ERROR: No cleaned data available for plotting.")
             return False
             
+        fig = None
         try:
             # Create market colors and style
             mc = mpf.make_marketcolors(up='g', down='r', inherit=True)
@@ -350,23 +437,39 @@ class StockChartAnalyzer:
                     os.makedirs(directory, exist_ok=True)
                 plot_kwargs['savefig'] = self.file_name
             
-            # Generate plot
-            mpf.plot(self.data_clean, **plot_kwargs)
+            # Generate plot (returnfig so the figure can be released right after saving)
+            with _PLOT_LOCK:
+                fig, _ = mpf.plot(self.data_clean, returnfig=True, **plot_kwargs)
             
             if save_file:
                 print(f"✅ Chart with labeled indicators saved as {self.file_name}")
             else:
-                print("✅ Chart generated successfully.")
+                buffer = BytesIO()
+                with _PLOT_LOCK:
+                    fig.savefig(buffer, format='png', bbox_inches='tight')
+                self.chart_bytes = buffer.getvalue()
+                print(f"✅ Chart generated in memory ({len(self.chart_bytes)} bytes).")
                 
             return True
             
         except Exception as e:
             print(f"🛑 ERROR: Failed to plot chart: {e}")
             return False
+
+        finally:
+            # Release the figure immediately instead of waiting for destroy()
+            if fig is not None:
+                with _PLOT_LOCK:
+                    plt.close(fig)
+                del fig
     
-    def generate_chart(self):
+    def generate_chart(self, in_memory=False):
         """
         Execute the complete analysis pipeline.
+
+        Args:
+            in_memory (bool): Render the PNG into self.chart_bytes instead of a file. An
+                unchanged last bar reuses the previously rendered bytes.
         
         Returns:
             bool: True if successful, False otherwise
@@ -376,16 +479,44 @@ class StockChartAnalyzer:
             ("Normalizing columns", self.normalize_columns),
             ("Cleaning data", self.clean_data),
             ("Calculating indicators", self.calculate_indicators),
-            ("Plotting chart", self.plot_chart)
+            ("Plotting chart", lambda: self.plot_chart(save_file=not in_memory))
         ]
         
         for step_name, step_func in steps:
+            if in_memory and step_name == "Calculating indicators" and self._load_cached_chart_bytes():
+                print(f"♻️ Reusing rendered chart for {self.ticker} {self.interval}: no new candle.")
+                return True
             print(f"\n--- {step_name} ---")
             if not step_func():
                 print(f"❌ Analysis failed at: {step_name}")
                 return False
-        
+
+        if in_memory:
+            self._store_chart_bytes()
+        return True
+
+    def _load_cached_chart_bytes(self):
+        """Sets self.chart_bytes from the render cache if this last bar was already rendered."""
+        key = self._last_bar_key()
+        with _CHART_BYTES_CACHE_LOCK:
+            chart_bytes = _CHART_BYTES_CACHE.get(key)
+            if chart_bytes is None:
+                return False
+            _CHART_BYTES_CACHE.move_to_end(key)
+        self.chart_bytes = chart_bytes
         return True
+
+    def _store_chart_bytes(self):
+        """Adds self.chart_bytes to the render cache, evicting the least recently used entry."""
+        with _CHART_BYTES_CACHE_LOCK:
+            _CHART_BYTES_CACHE[self._last_bar_key()] = self.chart_bytes
+            if len(_CHART_BYTES_CACHE) > CHART_BYTES_CACHE_SIZE:
+                _CHART_BYTES_CACHE.popitem(last=False)
+
+    def get_chart_bytes(self):
+        """Get the PNG bytes of the chart rendered with generate_chart(in_memory=True)."""
+        return self.chart_bytes
+
     def get_chart_file_name(self):
         """Get the file name of the saved chart."""
         return self.file_name
@@ -397,9 +528,9 @@ class StockChartAnalyzer:
             del self.data
             del self.data_clean
 
-            # Close all open matplotlib figures
-            import matplotlib.pyplot as plt
-            plt.close('all')
+            # Close all open matplotlib figures (never while another thread is mid-render)
+            with _PLOT_LOCK:
+                plt.close('all')
 
             # Delete other attributes (optional)
             del self.ticker
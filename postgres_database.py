@@ -1,4 +1,4 @@
-from datetime import date, datetime
+from sqlalchemy import func
 from config import AGENT_CONFIG
 from models.BorkerageCharges import BrokerageCharges
 from models.LLMDecision import LLMDecision
@@ -17,6 +17,9 @@ class PostgresDatabase:
     def __init__(self):
         # Create tables for all models
         Base.metadata.create_all(engine)
+        # create_all only builds indexes for new tables; add any missing ones to existing tables
+        for index in LLMDecision.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
         logger.info("✅ Database connection established and tables created (if not exist).")
         self.SessionLocal = SessionLocal
     # -------- CRUD Function --------
@@ -207,44 +210,64 @@ class PostgresDatabase:
             db.close()
     
     def get_today_decisions_for_instrument(self, instrument_key: str):
+        return self.get_today_decisions_for_instruments([instrument_key]).get(instrument_key, [])
+
+    def get_today_decisions_for_instruments(self, instrument_keys: list):
+        """
+        Fetches today's latest PREVIOUS_DECISIONS_TO_CONSIDER decisions for several instruments
+        in one round trip. Each instrument is an index range scan on
+        idx_llm_decision_instrument_created_on; row_number() keeps the newest N per instrument.
+
+        Returns:
+            dict: instrument_key -> list of decision dicts, newest first ([] if none).
+        """
+        decisions = {key: [] for key in instrument_keys}
+        if not instrument_keys:
+            return decisions
         db = self.SessionLocal()
         try:
-            today = date.today()
-
-            results = (
+            ranked = (
                 db.query(
+                    LLMDecision.instrument_key,
                     LLMDecision.created_on,
                     LLMDecision.thought,
                     LLMDecision.action,
                     LLMDecision.current_price,
                     LLMDecision.stop_loss,
                     LLMDecision.take_profit,
+                    func.row_number().over(
+                        partition_by=LLMDecision.instrument_key,
+                        order_by=LLMDecision.created_on.desc(),
+                    ).label("rn"),
                 )
                 .filter(
-                    LLMDecision.instrument_key == instrument_key,
-                    LLMDecision.created_on >= datetime.combine(today, datetime.min.time()),
-                    LLMDecision.created_on <= datetime.combine(today, datetime.max.time())
+                    LLMDecision.instrument_key.in_(instrument_keys),
+                    # Day boundary is computed by Postgres; range form keeps the index usable
+                    LLMDecision.created_on >= func.current_date()
                 )
-                .order_by(LLMDecision.id.desc())
-                .limit(AGENT_CONFIG["PREVIOUS_DECISIONS_TO_CONSIDER"])
+                .subquery()
+            )
+            results = (
+                db.query(ranked)
+                .filter(ranked.c.rn <= AGENT_CONFIG["PREVIOUS_DECISIONS_TO_CONSIDER"])
+                .order_by(ranked.c.instrument_key, ranked.c.created_on.desc())
                 .all()
             )
 
-            # convert results into a list of dicts
-            return [
-                {
+            # group results into lists of dicts per instrument
+            for r in results:
+                decisions[r.instrument_key].append({
                     "decision_on": r.created_on.strftime("%Y-%m-%d %H:%M:%S"),
                     "thought": r.thought,
                     "action": r.action,
                     "stock_price": r.current_price,
                     "stop_loss": r.stop_loss,
                     "take_profit": r.take_profit
-                }
-                for r in results
-            ]
+                })
+            return decisions
 
         except Exception as e:
             logger.error(f"❌ Error fetching today's decisions: {e}")
-            return []
+            return decisions
         finally:
             db.close()
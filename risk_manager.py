@@ -1,8 +1,48 @@
+import math
+from enum import IntEnum
+
 from logger_config import get_logger
+from schemas import Decision
 
 
 logger = get_logger(__name__)
 
+_floor = math.floor
+
+# --- Intraday equity charge rates (Upstox / NSE) ---
+BROKERAGE_RATE = 0.001          # 0.1% per order...
+BROKERAGE_CAP_PER_ORDER = 20.0  # ...capped at ₹20
+STT_RATE = 0.00025              # On sell value
+TRANSACTION_CHARGE_RATE = 0.0000297  # NSE, on turnover
+SEBI_FEE_RATE = 0.0000005       # On turnover
+STAMP_DUTY_RATE = 0.00003       # On buy value
+GST_RATE = 0.18                 # On brokerage + transaction charges + SEBI fees
+
+
+class RejectReason(IntEnum):
+    """Outcome of RiskManager.validate_decision(). OK and SELL_CLOSE are approvals."""
+    OK = 0
+    HOLD = 1
+    HALTED = 2
+    MAX_TRADES = 3
+    LOW_CONF = 4
+    SELL_CLOSE = 5
+
+    @property
+    def approved(self) -> bool:
+        # OK is 0 (falsy), so callers must test .approved rather than truthiness.
+        return self is RejectReason.OK or self is RejectReason.SELL_CLOSE
+
+
+REJECT_REASON_MESSAGES = {
+    RejectReason.OK: "BUY decision has been validated by the Risk Manager.",
+    RejectReason.HOLD: "Trade rejected: HOLD action.",
+    RejectReason.HALTED: "Trade rejected: Trading is halted for the day due to max loss limit breach.",
+    RejectReason.MAX_TRADES: "Trade rejected: Max trades limit reached for the day.",
+    RejectReason.LOW_CONF: "Trade rejected: Confidence is below threshold.",
+    RejectReason.SELL_CLOSE: "SELL action approved to close existing position.",
+}
+
 class RiskManager:
     """
     Handles real-time risk management for an intraday trading agent.
@@ -14,6 +54,12 @@ class RiskManager:
     4.  Acting as a circuit breaker by halting trading if daily loss limits are breached.
     """
 
+    __slots__ = (
+        "max_position_size", "stop_loss_pct", "take_profit_pct", "min_confidence_threshold",
+        "max_trades_per_day", "max_daily_loss_pct", "leverage_on_intraday",
+        "trades_today", "daily_pnl", "is_trading_halted", "_max_loss_amount",
+    )
+
     def __init__(self, config, agent_config):
         """
         Initializes the RiskManager with intraday-specific configuration.
@@ -35,56 +81,52 @@ class RiskManager:
         self.trades_today = 0
         self.daily_pnl = 0.0
         self.is_trading_halted = False
+        self._max_loss_amount = float('inf') # Set once per session by set_day_start_capital()
         
         logger.info("Intraday Risk Manager initialized with settings: %s", config)
 
-    def validate_decision(self, llm_decision: dict, portfolio: dict, current_price: float) -> bool:
+    def validate_decision(self, decision: Decision, portfolio: dict, current_price: float) -> RejectReason:
         """
         Assesses a trade decision from the LLM against all intraday risk rules.
 
+        Nothing is logged here so backtests can call this in a tight loop; the live
+        agent logs REJECT_REASON_MESSAGES[reason].
+
         Args:
-            llm_decision (dict): The decision object from the LLM.
+            decision (Decision): The decision from the LLM, see Decision.from_dict().
             portfolio (dict): The current state of the portfolio.
 
         Returns:
-            bool: True if the trade is approved, False otherwise.
+            RejectReason: OK or SELL_CLOSE if the trade is approved (see .approved), else the rejection reason.
         """
-        action = llm_decision.get('action')
-        confidence = llm_decision.get('confidence_score', 0)
-        quantity = llm_decision.get('quantity', 0)
-        available_margin = portfolio.get('available_margin', 0)
+        action = decision.action
 
-        # Rule 0: On 'HOLD'
+        # Rule 0: Halted for the day due to daily loss limit; applies to every action
+        if self.is_trading_halted:
+            return RejectReason.HALTED
+
+        # Rule 1: On 'HOLD'
         if action == 'HOLD':
-            logger.warning("Trade rejected: HOLD action.")
-            return False
+            return RejectReason.HOLD
 
+        # 'SELL' (to close positions)
+        if action == 'SELL':
+            return RejectReason.SELL_CLOSE
 
         # --- Pre-Trade Checks for BUY orders ---
 
-        # Rule 1: Check if trading is halted due to daily loss limit
-        if self.is_trading_halted:
-            logger.warning("Trade rejected: Trading is halted for the day due to max loss limit breach.")
-            return False
-            
-        # Rule 2: Check if max trades for the day have been reached
-        if self.trades_today >= self.max_trades_per_day:
-            logger.warning(f"Trade rejected: Max trades limit of {self.max_trades_per_day} reached for the day.")
-            return False
-
-        # Rule 3: Check LLM confidence score
-        if confidence < self.min_confidence_threshold:
-            logger.warning(f"Trade rejected: Confidence {confidence:.2f} is below threshold of {self.min_confidence_threshold:.2f}.")
-            return False
-        
-        # 'SELL' (to close positions)
-        if action == 'SELL':
-            logger.info("SELL action approved to close existing position.")
-            return True
+        # Rule 2: Check LLM confidence score
+        if decision.confidence_score < self.min_confidence_threshold:
+            return RejectReason.LOW_CONF
+
+        # Rule 3: Check if max trades for the day have been reached
+        trades_today = self.trades_today
+        if trades_today >= self.max_trades_per_day:
+            return RejectReason.MAX_TRADES
+
         # If all checks pass for a BUY order
-        logger.info("BUY decision has been validated by the Risk Manager.")
-        self.trades_today += 1 # Increment trade count only for approved BUYs
-        return True
+        self.trades_today = trades_today + 1 # Increment trade count only for approved BUYs
+        return RejectReason.OK
 
     def calculate_quantity(self, price: float) -> int:
         """
@@ -98,27 +140,73 @@ class RiskManager:
         """
         if price <= 0:
             return 0
-        quantity = int(self.max_position_size // price)
-        logger.info(f"Calculated quantity: {quantity} shares based on max position size of {self.max_position_size} at price {price}.")
+        quantity = _floor(self.max_position_size / price)
+        logger.info("Calculated quantity: %d shares based on max position size of %s at price %s.", quantity, self.max_position_size, price)
         return quantity
 
-    def update_pnl(self, pnl: float, starting_capital: float):
+    def compute_charges(self, quantity: float, buy_price: float, sell_price: float) -> dict:
+        """
+        Computes the round-trip intraday transaction charges for a trade.
+
+        Args:
+            quantity (float): Number of shares traded.
+            buy_price (float): Price of the buy leg.
+            sell_price (float): Price of the sell leg.
+
+        Returns:
+            dict: brokerage, stt, trans_charges, sebi_fees, stamp_duty, gst and total (in ₹).
+        """
+        buy_value = quantity * buy_price
+        sell_value = quantity * sell_price
+        total_turnover = buy_value + sell_value
+
+        brokerage = (min(BROKERAGE_CAP_PER_ORDER, BROKERAGE_RATE * buy_value)
+                     + min(BROKERAGE_CAP_PER_ORDER, BROKERAGE_RATE * sell_value))
+        stt = STT_RATE * sell_value
+        trans_charges = TRANSACTION_CHARGE_RATE * total_turnover
+        sebi_fees = SEBI_FEE_RATE * total_turnover
+        stamp_duty = STAMP_DUTY_RATE * buy_value
+        gst = GST_RATE * (brokerage + trans_charges + sebi_fees)
+
+        return {
+            "brokerage": brokerage,
+            "stt": stt,
+            "trans_charges": trans_charges,
+            "sebi_fees": sebi_fees,
+            "stamp_duty": stamp_duty,
+            "gst": gst,
+            "total": brokerage + stt + trans_charges + sebi_fees + stamp_duty + gst,
+        }
+
+    def set_day_start_capital(self, starting_capital: float):
+        """
+        Fixes the daily loss limit from the portfolio's starting capital for the session.
+
+        Args:
+            starting_capital (float): The portfolio's starting cash for the day.
+        """
+        self._max_loss_amount = starting_capital * self.max_daily_loss_pct
+        logger.info("Daily loss limit set to %.2f on starting capital of %.2f.", self._max_loss_amount, starting_capital)
+
+    def update_pnl(self, pnl: float, starting_capital: float = None):
         """
         Updates the daily Profit and Loss and checks the daily loss limit.
         
         Args:
             pnl (float): The profit or loss from the most recently closed trade.
-            starting_capital (float): The portfolio's starting cash for the day.
+            starting_capital (float, optional): Ignored; kept for backwards compatibility.
+                The limit comes from set_day_start_capital().
         """
-        self.daily_pnl += pnl
-        logger.info(f"Trade closed. P&L: {pnl:.2f}. Total Daily P&L: {self.daily_pnl:.2f}")
+        daily_pnl = self.daily_pnl + pnl
+        self.daily_pnl = daily_pnl
+        logger.info("Trade closed. P&L: %.2f. Total Daily P&L: %.2f", pnl, daily_pnl)
 
         # Check for max daily loss breach
-        max_loss_amount = starting_capital * self.max_daily_loss_pct
-        if self.daily_pnl < -max_loss_amount:
+        max_loss_amount = self._max_loss_amount
+        if daily_pnl < -max_loss_amount:
             self.is_trading_halted = True
             logger.critical(
-                f"MAX DAILY LOSS LIMIT BREACHED! P&L {-self.daily_pnl:.2f} exceeds limit of {max_loss_amount:.2f}."
-                " Halting all new BUY orders for the day."
+                "MAX DAILY LOSS LIMIT BREACHED! P&L %.2f exceeds limit of %.2f."
+                " Halting all new BUY orders for the day.",
+                -daily_pnl, max_loss_amount,
             )
-
@@ -0,0 +1,46 @@
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class Decision:
+    """
+    The fields of an LLM trade decision that the risk checks read.
+
+    Built once per decision with Decision.from_dict() so RiskManager does plain
+    attribute loads instead of dict lookups with defaults.
+    """
+    action: str
+    confidence_score: float = 0.0
+    quantity: int = 0
+    instrument_key: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Decision":
+        """Builds a Decision from the parsed LLM JSON response."""
+        return cls(
+            action=data.get('action'),
+            confidence_score=float(data.get('confidence_score') or 0.0),
+            quantity=int(data.get('quantity') or 0),
+            instrument_key=data.get('instrument_key') or "",
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class Instrument:
+    """
+    One row of the NSE instrument master.
+
+    UpstoxClient keeps one of these per instrument for the whole session, so
+    slots keep the table small; to_dict() gives callers their own plain dict.
+    """
+    instrument_key: str
+    trading_symbol: str
+    name: str
+
+    def to_dict(self) -> dict:
+        """Returns the instrument as the dict shape used across the agent and prompts."""
+        return {
+            'instrument_key': self.instrument_key,
+            'trading_symbol': self.trading_symbol,
+            'name': self.name,
+        }
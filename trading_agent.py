@@ -1,9 +1,14 @@
-import json
+import hashlib
+import heapq
+import orjson
 import copy
 import random
 import sys
 import time
-from threading import Timer
+from collections import OrderedDict
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Event, Lock, Thread
 from config import NSE_STOCKS, AGENT_CONFIG, DATABASE_CONFIG, UPSTOX_CONFIG,DECISION_CHART_PLOT_CONFIG
 from flask_api import FlaskAPI
 from gemini_llm_integration import GeminiLLMClient
@@ -14,10 +19,16 @@ from nse_500_fetcher import NSE500Fetcher
 from plot_graph_of_stock import StockChartAnalyzer
 from postgres_database import PostgresDatabase
 from upstox_wrapper import UpstoxClient
-from risk_manager import RiskManager
-from datetime import datetime, timedelta
+from utils.TokenBucket import TokenBucket
+from risk_manager import REJECT_REASON_MESSAGES, RiskManager
+from schemas import Decision
+from datetime import date, datetime, timedelta
 
 logger = get_logger(__name__)
+
+LLM_DECISION_CACHE_SIZE = 256
+ANALYZER_POOL_SIZE = 64
+
 class TradingAgent:
     """
     The main trading agent that orchestrates the entire trading process.
@@ -48,14 +59,36 @@ class TradingAgent:
         self.leverage_on_intraday = agent_config['LEVERAGE_ON_INTRADAY']
         self.auto_pick_stock = agent_config['AUTO_PICK_STOCK']
         self.market_close_time = datetime.strptime(agent_config['MARKET_CLOSE_TIME'], '%H:%M').time()
-        self.decision_timer = None 
+        self._market_close_ts = 0.0
+        self._market_close_valid_until = 0.0 # Next local midnight; the close timestamp is recomputed after it
+        self.decision_trigger_bps = agent_config['DECISION_TRIGGER_BPS']
+        self.decision_thread = None
+        # Set by on_market_data on a large enough move, so the next cycle runs before the interval elapses
+        self._decision_event = Event()
+        self._stop_event = Event()
+        self.market_data = {}
+        self.market_intraday_data = {}
+        self._reference_ltp = {} # instrument_key -> LTP at the last decision cycle for it
         self.is_eod_squaring_off = False
+        # Paces Upstox REST calls from concurrent workers to the broker's request rate
+        self._rate_limiter = TokenBucket(agent_config['UPSTOX_REQUESTS_PER_SECOND'], agent_config['UPSTOX_REQUEST_BURST'])
+        self._instrument_executor = ThreadPoolExecutor(max_workers=agent_config['MAX_PARALLEL_INSTRUMENTS'], thread_name_prefix="instrument")
+        self._trade_lock = Lock()
+        # signature -> (monotonic timestamp, llm_json); LRU-ordered, see _llm_decision_signature()
+        self.llm_decision_cache_ttl = agent_config['LLM_DECISION_CACHE_TTL_SECONDS']
+        self._llm_decision_cache = OrderedDict()
+        self._llm_decision_cache_lock = Lock()
+        self._ltp_cache = None # (monotonic timestamp, NSE 500 LTP data), see get_nse500_ltp()
+        self._ltp_cache_lock = Lock()
+        self._prev_decision_fmt_cache = {} # instrument_key -> {decision_on: formatted row}
+        self._analyzer_pool = OrderedDict() # (stock_name, period, interval) -> (IntradayAnalyzer, Lock), LRU bounded by ANALYZER_POOL_SIZE
+        self._analyzer_pool_lock = Lock()
 
     def start(self):
         """Starts the trading agent."""
         logger.info("Starting trading agent...")
         upstox_config = UPSTOX_CONFIG
-
+        starting_capital = 0.0
 
         for config in upstox_config:
             upstox_client = UpstoxClient(**config)
@@ -65,23 +98,50 @@ class TradingAgent:
             user_profile = upstox_client.get_profile()  # Get User Profile
             self.db.save_user_details(user_profile)
 
-            upstox_client.get_user_fund_margin() # User Fund Margin
+            user_fund_margin = upstox_client.get_user_fund_margin() # User Fund Margin
+            if user_fund_margin:
+                starting_capital += user_fund_margin.get('available_margin') or 0
 
             upstox_client.connect_portofolio_data_streamer(self.update_portfolio_positions, self.save_order_details) # Connect to Profile Data Streamer
+            # Streamed LTPs drive early decision cycles (see on_market_data); instruments are subscribed per cycle
+            upstox_client.connect_market_data_streamer(self.on_market_data, self.on_market_intraday_data)
 
             self.upstox_clients.append(upstox_client)
 
+        if starting_capital > 0:
+            self.risk_manager.set_day_start_capital(starting_capital)
         time.sleep(2)
-        self.make_decision()
+        self.decision_thread = Thread(target=self._decision_loop, name="decision-loop", daemon=True)
+        self.decision_thread.start()
 
-    def _start_decision_timer(self):
-        """Starts a recurring timer to trigger the decision-making process."""
-        if self.decision_timer:
-            self.decision_timer.cancel()
-        
-        if not self.is_eod_squaring_off:
-            self.decision_timer = Timer(self.decision_interval, self.make_decision)
-            self.decision_timer.start()
+    def _decision_loop(self):
+        """
+        Runs a decision cycle immediately, then whenever on_market_data signals a significant
+        price move, or at the latest every DECISION_INTERVAL_SECONDS.
+        """
+        while not self._stop_event.is_set() and not self.is_eod_squaring_off:
+            self._decision_event.clear()
+            try:
+                self.make_decision()
+            except Exception as e:
+                logger.error("Decision cycle failed: %s", e)
+            self._decision_event.wait(timeout=self.decision_interval)
+
+    def _feed_ltp(self, feed_data):
+        """Extracts the last traded price from a market data streamer feed, or None."""
+        ltpc = feed_data.get('fullFeed', {}).get('marketFF', {}).get('ltpc') or feed_data.get('ltpc') or {}
+        return ltpc.get('ltp')
+
+    def _reset_reference_ltps(self, instrument_keys, market_quotes):
+        """Records the LTP each instrument is decided at, so feed moves are measured since the last decision."""
+        for instrument_key in instrument_keys:
+            quote = next(iter(market_quotes.get(instrument_key, {}).values()), {})
+            ltp = quote.get('last_price') or self._feed_ltp(self.market_data.get(instrument_key, {}))
+            if ltp:
+                self._reference_ltp[instrument_key] = ltp
+            else:
+                # Unknown price: the next feed update becomes the reference
+                self._reference_ltp.pop(instrument_key, None)
 
     def on_market_data(self, message):
         """
@@ -94,6 +154,14 @@ class TradingAgent:
         # logger.info(f"Market data received: {message}")
         for instrument_key, feed_data in message.items():
             self.market_data[instrument_key] = feed_data
+            ltp = self._feed_ltp(feed_data)
+            if not ltp:
+                continue
+            reference = self._reference_ltp.setdefault(instrument_key, ltp)
+            # The reference is reset by the decision cycle itself (see _run_instruments)
+            if abs(ltp - reference) / reference * 10000 >= self.decision_trigger_bps and not self._decision_event.is_set():
+                logger.info("%s moved %s -> %s; triggering an early decision cycle.", instrument_key, reference, ltp)
+                self._decision_event.set()
         # The data is also stored in self.market_data, which we'll use.
     def on_market_intraday_data(self, message):
         """
@@ -110,96 +178,216 @@ class TradingAgent:
     def make_decision(self):
         """
         The core logic loop: analyze data, get LLM decision, check risk, and execute.
-        This function is called periodically by the timer.
+        This function is called by the decision loop (see _decision_loop).
         """
-        now = datetime.now().time()
-        if now >= self.market_close_time:
+        if time.time() >= self._get_market_close_ts():
             if not self.is_eod_squaring_off:
                 self.square_off_all_positions()
             return
         # Update Portfolio Positions
         for upstox_client in self.upstox_clients:
+            self._rate_limiter.acquire()
             portfolio_margin = upstox_client.get_user_fund_margin() # Get Portfolio Margin
-            position_present = True
             all_positions, open_positions = self.get_portfolio_positions(upstox_client)
-            instruments_to_trade = []
-            if(open_positions == {}):
-                position_present = False
-                instruments_to_trade = self.get_instruments_to_trade(portfolio_margin)
+            # Positions are fetched once per cycle; dispatch once instead of branching per instrument
+            if open_positions:
+                self._cycle_manage_open(upstox_client, portfolio_margin, all_positions, open_positions)
             else:
-                instrument_keys = list(open_positions.keys())
-                for key in instrument_keys:                
-                    instrument_to_trade = upstox_client.get_instrument_info_from_instrument_key(key)
-                    if instrument_to_trade:
-                        instruments_to_trade.append(instrument_to_trade)
-
-            logger.info(f"Instruments to trade: {instruments_to_trade}")
-            number_of_instruments_to_trade = len(instruments_to_trade)
-            for instrument_to_trade in instruments_to_trade:
-                logger.info(f"---------- Starting new decision cycle for {instrument_to_trade['trading_symbol']} ----------")
-                start_time = datetime.now()
-                trading_symbol = instrument_to_trade['trading_symbol']
-                instrument_key = instrument_to_trade['instrument_key']
-                stock_name = instrument_to_trade['name']
-                logger.info(f"Instrument to Trade : {trading_symbol} : {instrument_key} : {stock_name}")
-                market_data = upstox_client.get_full_market_quote(instrument_key)
-                if market_data == {}:
-                    logger.error("No market data received. Skipping cycle.")
-                    pass 
-                portfolio_margin = upstox_client.get_user_fund_margin()
-                market_intraday_data = upstox_client.get_intra_day_candle_data(instrument_key) #Intraday Candle Data
-                technical_summary = self.get_technical_summary(trading_symbol,market_data) #Technical Summary
-                stock_news = self.news_api_client.get_company_news(stock_name) #Stock News
-                all_positionss, open_positionss = self.get_portfolio_positions(upstox_client)
-                position = {instrument_key: open_positionss.get(instrument_key, {})} # Latest Position Data for Instrument
-                previous_decision = self.db.get_today_decisions_for_instrument(instrument_key)
-                previous_decision_str = self.format_previous_decision(previous_decision) # Format previous_decision
-                chart_plot_image_paths = self.get_chart_plot_image_paths(trading_symbol)
-                logger.info(f"Previous Decision : {previous_decision_str}")
-                logger.info(f"Instrument to Trade : {instrument_to_trade}")
-                logger.info(f"Position Margin : {portfolio_margin}")
-                logger.info(f"Current Position : {position}")
-                logger.info(f"Market Data : {market_data}")
-                # logger.info(f"Intraday Candle Data : {market_intraday_data_str}")
-                logger.info(f"Technical Summary : {technical_summary}")
-                logger.info(f"Stock News : {stock_news}")
-                # Decision from LLM
-                llm_json = None
-                if not position_present:
-                    llm_json = self.llm_client.generate_decision_for_new_trade(instrument_key, instrument_to_trade, market_data, market_intraday_data, portfolio_margin, position ,technical_summary, stock_news,previous_decision_str,number_of_instruments_to_trade,chart_plot_image_paths,all_positionss, self.leverage_on_intraday)
-                else:
-                    llm_json = self.llm_client.generate_decision_for_position_present(instrument_key, instrument_to_trade, market_data, market_intraday_data, portfolio_margin, position ,technical_summary, stock_news,previous_decision_str,number_of_instruments_to_trade,chart_plot_image_paths,all_positionss, self.leverage_on_intraday)
-
-                self.db.save_llm_decision(llm_json)
-                llm_decision = llm_json['response']
-                if not llm_decision or 'action' not in llm_decision:
-                    logger.error("Invalid or empty decision from LLM. Skipping cycle.")
-                    pass # Restart timer for next cycle
-
-                action = llm_decision.get('action')
-                instrument_key = llm_decision.get('instrument_key')
-                current_price = llm_decision.get('current_price',0.0)
-
-                logger.info(f"LLM Decision for {instrument_key}: {action}. Thought: {llm_decision.get('thought')} at price ~{current_price}")
-                # Process trade decisions
-                if llm_decision and self.risk_manager.validate_decision(llm_decision, portfolio_margin, current_price):
-                    if current_price:
-                         quantity = llm_decision.get('quantity', 0)
-                         self.execute_trade(upstox_client, llm_decision, current_price, quantity)
-                end_time = datetime.now()
-                duration = (end_time - start_time).total_seconds()
-                logger.info(f"---------- Decision cycle completed for {trading_symbol} : {instrument_key} : {stock_name} in {duration} seconds----------")
-                number_of_instruments_to_trade-=1
-                time.sleep(5)
+                self._cycle_new_entry(upstox_client, portfolio_margin, all_positions)
 
         now = datetime.now()
         next_decision_time = now + timedelta(seconds=self.decision_interval)
         next_decision_time = next_decision_time.strftime('%Y-%m-%d %H:%M:%S')
-        logger.info(f"---------- Next Decision in {self.decision_interval} seconds at {next_decision_time} ----------")
-        self._start_decision_timer()
+        logger.info("---------- Next Decision in at most %s seconds, by %s ----------", self.decision_interval, next_decision_time)
+
+    def _get_market_close_ts(self):
+        """Returns today's market close as an epoch timestamp, recomputed once per day."""
+        if time.time() >= self._market_close_valid_until:
+            today = date.today()
+            self._market_close_ts = datetime.combine(today, self.market_close_time).timestamp()
+            self._market_close_valid_until = datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+        return self._market_close_ts
+
+    def _cycle_manage_open(self, upstox_client, portfolio_margin, all_positions, open_positions):
+        """Decision cycle for a client holding open positions: manage each open instrument."""
+        instruments_to_trade = []
+        for key in open_positions:
+            instrument_to_trade = upstox_client.get_instrument_info_from_instrument_key(key)
+            if instrument_to_trade:
+                instruments_to_trade.append(instrument_to_trade)
+        self._run_instruments(upstox_client, instruments_to_trade, portfolio_margin, all_positions, open_positions,
+                              self.llm_client.generate_decision_for_position_present)
+
+    def _cycle_new_entry(self, upstox_client, portfolio_margin, all_positions):
+        """Decision cycle for a client with no open positions: pick instruments and look for new entries."""
+        instruments_to_trade = self.get_instruments_to_trade(portfolio_margin)
+        self._run_instruments(upstox_client, instruments_to_trade, portfolio_margin, all_positions, {},
+                              self.llm_client.generate_decision_for_new_trade)
+
+    def _run_instruments(self, upstox_client, instruments_to_trade, portfolio_margin, all_positions, open_positions, decide):
+        """
+        Prefetches the per-cycle data in batches and runs _process_instrument for every instrument.
+        Each cycle is dominated by network waits (quotes, candles, news, LLM, DB), so instruments
+        are processed concurrently; trade execution is serialized inside.
+        """
+        logger.info("Instruments to trade: %s", instruments_to_trade)
+        number_of_instruments_to_trade = len(instruments_to_trade)
+        # One quote request for every instrument in the cycle instead of one per instrument
+        instrument_keys = [i['instrument_key'] for i in instruments_to_trade]
+        # Stream the instruments being traded so their price moves can trigger the next cycle early
+        new_keys = [key for key in instrument_keys if key not in upstox_client.subscribed_instruments]
+        if new_keys:
+            upstox_client.subscribe(new_keys)
+        self._rate_limiter.acquire()
+        market_quotes = upstox_client.get_full_market_quote_batch(instrument_keys)
+        self._reset_reference_ltps(instrument_keys, market_quotes)
+        previous_decisions = self.db.get_today_decisions_for_instruments(instrument_keys)
+        news_by_name = self.news_api_client.get_company_news_batch([i['name'] for i in instruments_to_trade])
+        # Margin fetched once per cycle; refreshed only after an order is placed (see _process_instrument)
+        cycle_margin = {'portfolio_margin': portfolio_margin}
+        futures = [
+            self._instrument_executor.submit(self._process_instrument, upstox_client, instrument_to_trade, decide,
+                                             number_of_instruments_to_trade - i,
+                                             market_quotes.get(instrument_to_trade['instrument_key'], {}),
+                                             previous_decisions.get(instrument_to_trade['instrument_key'], []),
+                                             news_by_name.get(instrument_to_trade['name'], []),
+                                             all_positions, open_positions, cycle_margin)
+            for i, instrument_to_trade in enumerate(instruments_to_trade)
+        ]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error("Decision cycle failed: %s", e)
+
+    def _process_instrument(self, upstox_client, instrument_to_trade, decide, number_of_instruments_to_trade, market_data, previous_decision, stock_news, all_positions, open_positions, cycle_margin):
+        """
+        Runs one decision cycle (data gathering, LLM decision, risk check, execution) for a single instrument.
+        decide is the LLM method for the cycle's path (new trade or position present).
+        cycle_margin holds the client's margin for the cycle, shared by all instrument workers.
+        """
+        logger.info("---------- Starting new decision cycle for %s ----------", instrument_to_trade['trading_symbol'])
+        start_time = datetime.now()
+        trading_symbol = instrument_to_trade['trading_symbol']
+        instrument_key = instrument_to_trade['instrument_key']
+        stock_name = instrument_to_trade['name']
+        logger.info("Instrument to Trade : %s : %s : %s", trading_symbol, instrument_key, stock_name)
+        if market_data == {}:
+            logger.error("No market data received. Skipping cycle.")
+            pass 
+        portfolio_margin = cycle_margin['portfolio_margin']
+        self._rate_limiter.acquire()
+        market_intraday_data = upstox_client.get_intra_day_candle_data(instrument_key) #Intraday Candle Data
+        technical_summary = self.get_technical_summary(trading_symbol,market_data) #Technical Summary
+        position = {instrument_key: open_positions.get(instrument_key, {})} # Position Data for Instrument
+        previous_decision_str = self.format_previous_decision(previous_decision, instrument_key) # Format previous_decision
+        chart_plot_images = self.get_chart_plot_images(trading_symbol)
+        transaction_charges = self.get_transaction_charges_summary(instrument_key, position, market_data, portfolio_margin)
+        logger.info("Previous Decision : %s", previous_decision_str)
+        logger.debug("Instrument to Trade : %s", instrument_to_trade)
+        logger.info("Position Margin : %s", portfolio_margin)
+        logger.info("Current Position : %s", position)
+        logger.debug("Market Data : %s", market_data)
+        # logger.info(f"Intraday Candle Data : {market_intraday_data_str}")
+        logger.debug("Technical Summary : %s", technical_summary)
+        logger.debug("Stock News : %s", stock_news)
+        # Decision from LLM (memoized on the inputs that drive it, see _llm_decision_signature)
+        signature = self._llm_decision_signature(upstox_client, decide.__name__, technical_summary, stock_news, position, market_data,
+                                                 portfolio_margin, previous_decision_str, transaction_charges)
+        llm_json = self._get_cached_llm_decision(signature)
+        from_cache = llm_json is not None
+        if llm_json is None:
+            llm_json = decide(instrument_key, instrument_to_trade, market_data, market_intraday_data, portfolio_margin, position ,technical_summary, stock_news,previous_decision_str,number_of_instruments_to_trade,chart_plot_images,all_positions, self.leverage_on_intraday, transaction_charges)
+            self.db.save_llm_decision(llm_json)
+            self._store_llm_decision(signature, llm_json)
+        else:
+            logger.info("Reusing cached LLM decision for %s; inputs unchanged.", instrument_key)
+        llm_decision = llm_json['response']
+        if not llm_decision or 'action' not in llm_decision:
+            logger.error("Invalid or empty decision from LLM. Skipping cycle.")
+            pass # Restart timer for next cycle
+
+        action = llm_decision.get('action')
+        instrument_key = llm_decision.get('instrument_key')
+        current_price = llm_decision.get('current_price',0.0)
+
+        logger.info("LLM Decision for %s: %s. Thought: %s at price ~%s", instrument_key, action, llm_decision.get('thought'), current_price)
+        # Process trade decisions
+        if llm_decision:
+            # Risk state (trades_today, halt flag) is shared across instrument workers
+            with self._trade_lock:
+                # Re-read: another worker may have placed an order and refreshed the margin
+                portfolio_margin = cycle_margin['portfolio_margin']
+                reason = self.risk_manager.validate_decision(Decision.from_dict(llm_decision), portfolio_margin, current_price)
+                if not reason.approved:
+                    logger.warning("%s: %s", instrument_key, REJECT_REASON_MESSAGES[reason])
+                elif from_cache:
+                    # Only HOLDs are cached; an order is never placed from a replayed decision
+                    logger.warning("%s: cached %s decision not executed", instrument_key, action)
+                elif current_price:
+                    logger.info("%s: %s", instrument_key, REJECT_REASON_MESSAGES[reason])
+                    quantity = llm_decision.get('quantity', 0)
+                    if self.execute_trade(upstox_client, llm_decision, current_price, quantity):
+                        self._rate_limiter.acquire()
+                        cycle_margin['portfolio_margin'] = upstox_client.get_user_fund_margin() or portfolio_margin
+        end_time = datetime.now()
+        duration = (end_time - start_time).total_seconds()
+        logger.info("---------- Decision cycle completed for %s : %s : %s in %s seconds----------", trading_symbol, instrument_key, stock_name, duration)
+
+    def _llm_decision_signature(self, upstox_client, decision_path, technical_summary, stock_news, position, market_data,
+                                portfolio_margin, previous_decision_str, transaction_charges):
+        """
+        Hashes the inputs that drive an LLM decision: the user, their margin, technical summary,
+        news headlines, position, previous decisions, charges, the quarter hour of the day (the
+        prompts' end-of-day rules) and the last price rounded to 0.1. Identical signatures within
+        the TTL reuse the previous decision instead of calling the LLM again.
+        """
+        quote = next(iter((market_data or {}).values()), {})
+        now = datetime.now()
+        signature = {
+            "user": (upstox_client.user_profile or {}).get('user_id') or upstox_client.api_key,
+            "margin": portfolio_margin,
+            "previous_decisions": previous_decision_str,
+            "charges": transaction_charges,
+            "quarter_hour": (now.hour * 60 + now.minute) // 15,
+            "decision_path": decision_path,
+            "tech": technical_summary,
+            "news_ids": [(n.get('title'), n.get('published_at')) for n in (stock_news or [])],
+            "position": position,
+            "price_bucket": round(quote.get('last_price') or 0.0, 1),
+        }
+        payload = orjson.dumps(signature, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY, default=str)
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def _get_cached_llm_decision(self, signature):
+        """Returns the cached llm_json for a signature if it is still within the TTL, else None."""
+        with self._llm_decision_cache_lock:
+            entry = self._llm_decision_cache.get(signature)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= self.llm_decision_cache_ttl:
+                del self._llm_decision_cache[signature]
+                return None
+            self._llm_decision_cache.move_to_end(signature)
+            return entry[1]
+
+    def _store_llm_decision(self, signature, llm_json):
+        """
+        Caches a successful HOLD response, evicting the least recently used entry past LLM_DECISION_CACHE_SIZE.
+        BUY/SELL are never cached: replaying one would place the order again (e.g. while a LIMIT order is unfilled).
+        """
+        if not llm_json or not llm_json.get('response'):
+            return
+        if llm_json['response'].get('action') != 'HOLD':
+            return
+        with self._llm_decision_cache_lock:
+            self._llm_decision_cache[signature] = (time.monotonic(), llm_json)
+            self._llm_decision_cache.move_to_end(signature)
+            if len(self._llm_decision_cache) > LLM_DECISION_CACHE_SIZE:
+                self._llm_decision_cache.popitem(last=False)
 
     def execute_trade(self,upstox_client, decision, price, quantity):
-        """Executes a trade based on the validated decision."""
+        """Executes a trade based on the validated decision. Returns the order data, or None if no order was placed."""
         instrument = decision['instrument_key']
         action = decision['action']
         order_type = decision['order_type']
@@ -208,40 +396,45 @@ class TradingAgent:
 
         
         if action == 'BUY':
-            logger.info(f"Executing INTRADAY BUY for {quantity} of {instrument} at ~{price}")
-            self.execute_buy(upstox_client, instrument,quantity, price, order_type, stop_loss,take_profit )
-            
-            
+            logger.info("Executing INTRADAY BUY for %s of %s at ~%s", quantity, instrument, price)
+            return self.execute_buy(upstox_client, instrument,quantity, price, order_type, stop_loss,take_profit )
+
 
         elif action == 'SELL':
-            logger.info(f"Executing INTRADAY SELL for {quantity} of {instrument} at ~{price}")
-            self.execute_sell(upstox_client, instrument, quantity, price, order_type,stop_loss, take_profit)
+            logger.info("Executing INTRADAY SELL for %s of %s at ~%s", quantity, instrument, price)
+            return self.execute_sell(upstox_client, instrument, quantity, price, order_type,stop_loss, take_profit)
+        return None
 
     def execute_buy(self,upstox_client, instrument_key, quantity, price, order_type, stop_loss,take_profit ):
         """Handles the logic for Buying a position and updating the portfolio_margin."""
             # Check if we already have a position
         if not price:
-            logger.error(f"Cannot execute BUY for {instrument_key}, no price data.")
+            logger.error("Cannot execute BUY for %s, no price data.", instrument_key)
             return
 
-        logger.info(f"Executing BUY for {quantity} of {instrument_key} at ~{price}")
+        logger.info("Executing BUY for %s of %s at ~%s", quantity, instrument_key, price)
+        self._rate_limiter.acquire()
         order_result = upstox_client.place_order(instrument_key, quantity, 'BUY', order_type , price, 'I', 'DAY', stop_loss,take_profit)
+        return order_result
 
     def execute_sell(self,upstox_client, instrument_key, quantity, price, order_type, stop_loss,take_profit ):
         """Handles the logic for selling a position and updating the portfolio_margin."""
         if not price:
-            logger.error(f"Cannot execute sell for {instrument_key}, no price data.")
+            logger.error("Cannot execute sell for %s, no price data.", instrument_key)
             return
 
-        logger.info(f"Executing SELL for {quantity} of {instrument_key} at ~{price}")
+        logger.info("Executing SELL for %s of %s at ~%s", quantity, instrument_key, price)
+        self._rate_limiter.acquire()
         order_result = upstox_client.place_order(instrument_key, quantity, 'SELL', order_type , price, 'I', 'DAY', stop_loss,take_profit)
+        return order_result
         
 
     def stop(self):
         """Stops the trading agent and disconnects services."""
         logger.info("Stopping trading agent...")
-        if self.decision_timer:
-            self.decision_timer.cancel()
+        self._stop_event.set()
+        self._decision_event.set()
+        self._instrument_executor.shutdown(wait=False, cancel_futures=True)
 
         logger.info("Trading agent stopped. Exiting program...")
         sys.exit(0)
@@ -249,72 +442,93 @@ class TradingAgent:
         """Update portfolio_positions with positions data"""
         try:
             if positions_data:
-                logger.info(f"Portfolio positions : {positions_data}")
+                logger.info("Portfolio positions : %s", positions_data)
         except Exception as e:
-            logger.error(f"Error updating portfolio_positions positions: {e}")
+            logger.error("Error updating portfolio_positions positions: %s", e)
     
     
     def get_portfolio_positions(self, upstox_client):
         """Update portfolio_positions with positions data"""
         try:
+            self._rate_limiter.acquire()
             all_positions_data = upstox_client.get_positions()
-            open_positions_dic = {}
-            if all_positions_data:
-                for pos in all_positions_data:
-                    if pos.quantity != 0 and pos.product=="I":
-                        instrument_token = pos.instrument_token
-                        open_positions_dic[instrument_token] = pos
-                        logger.info(f"Updated portfolio open position for {instrument_token}: {pos}")
+            open_positions_dic = {
+                pos.instrument_token: pos
+                for pos in (all_positions_data or [])
+                if pos.quantity != 0 and pos.product == "I"
+            }
+            logger.debug("Open portfolio positions: %s", open_positions_dic)
             return all_positions_data,open_positions_dic
         except Exception as e:
-            logger.error(f"Error updating portfolio_positions positions: {e}")
-            return {}
+            logger.error("Error updating portfolio_positions positions: %s", e)
+            return [], {}
 
     def square_off_all_positions(self):
         """Closes all open positions before market close."""
         logger.warning("MARKET CLOSING SOON. Squaring off all open positions.")
         self.is_eod_squaring_off = True
-        if self.decision_timer:
-            self.decision_timer.cancel()
+        self._decision_event.set()
         for upstox_client in self.upstox_clients:
             upstox_client.exit_all_positions()
         self.stop()
 
+    def get_nse500_ltp(self, upstox_client):
+        """
+        Returns the NSE 500 LTP snapshot, reused for DECISION_INTERVAL_SECONDS so every
+        user in a decision cycle shares one ~500-key LTP request.
+        """
+        with self._ltp_cache_lock:
+            if self._ltp_cache and time.monotonic() - self._ltp_cache[0] < self.decision_interval:
+                return self._ltp_cache[1]
+            nse_instrument_keys_str = self.nse_500_fetcher.get_instrument_list_csv()
+            self._rate_limiter.acquire()
+            ltp_data = upstox_client.get_last_trading_price(nse_instrument_keys_str,"v3") or {}
+            logger.info("Fetched LTP of %s Stocks", len(ltp_data))
+            if ltp_data:
+                self._ltp_cache = (time.monotonic(), ltp_data)
+            return ltp_data
+
     def auto_pick_instrument_to_trade(self, upstox_client, portfolio_margin):
-        nse_instrument_keys = self.nse_500_fetcher.get_instrument_list()   
-        nse_instrument_keys_str = ",".join(nse_instrument_keys[:499]) 
-        ltp_data = upstox_client.get_last_trading_price(nse_instrument_keys_str,"v3")
-        logger.info(f"Fetched LTP of {len(ltp_data)} Stocks")
-
-        affordable_instruments = []
-        for key, value in ltp_data.items():
-            if value.last_price <= portfolio_margin['available_margin']:
-                instrument ={
-                    "instrument_key": value.instrument_token,
-                    "last_price": value.last_price,
-                    "stock_name": key.split(":")[1]
-                }
-                affordable_instruments.append(instrument)
-        affordable_instruments = sorted(affordable_instruments, key=lambda x: x['last_price'], reverse=True)
-        logger.info(f"Affordable instruments for user {upstox_client.user_profile['user_name']}: {len(affordable_instruments)}")
+        ltp_data = self.get_nse500_ltp(upstox_client)
+
+        available_margin = portfolio_margin['available_margin']
+        affordable_instruments = [
+            {
+                "instrument_key": value.instrument_token,
+                "last_price": value.last_price,
+                "stock_name": key.split(":")[1]
+            }
+            for key, value in ltp_data.items()
+            if value.last_price <= available_margin
+        ]
+        logger.info("Affordable instruments for user %s: %s", upstox_client.user_profile['user_name'], len(affordable_instruments))
 
         stocks_to_compare = []
         number_of_stocks_to_compare = AGENT_CONFIG["SELECT_STOCK_COUNT_TO_COMPARE"]
         if(AGENT_CONFIG["RANDOM_SELECT_STOCKS"]):
             stocks_to_compare = random.sample(affordable_instruments, min(number_of_stocks_to_compare, len(affordable_instruments)))
         else:
-            stocks_to_compare = affordable_instruments[:number_of_stocks_to_compare]
+            # Top-k by price without sorting the whole ~500 list
+            stocks_to_compare = heapq.nlargest(number_of_stocks_to_compare, affordable_instruments, key=itemgetter('last_price'))
 
-        logger.info(f"Getting {number_of_stocks_to_compare} stocks to compare : {stocks_to_compare}")
-        technical_summaries = []
-        for index, instrument in enumerate(stocks_to_compare, 1):
-            full_market_data = upstox_client.get_full_market_quote(instrument['instrument_key'])
+        logger.debug("Getting %s stocks to compare : %s", number_of_stocks_to_compare, stocks_to_compare)
+        # One quote request for all candidates, then summaries and charts built concurrently
+        self._rate_limiter.acquire()
+        market_quotes = upstox_client.get_full_market_quote_batch([i['instrument_key'] for i in stocks_to_compare])
+
+        def _score_one(index, instrument):
+            full_market_data = market_quotes.get(instrument['instrument_key'], {})
             technical_summary =  self.get_technical_summary(instrument['stock_name'], full_market_data)
             technical_summary['instrument_key'] = instrument['instrument_key']
             chart_plot_image_path = self.get_chart_plot_image_path_for_stock_selection(instrument['stock_name'])
             technical_summary['chart_plot_image_path'] = chart_plot_image_path
             technical_summary['index'] = index
-            technical_summaries.append(technical_summary)
+            return technical_summary
+
+        technical_summaries = []
+        if stocks_to_compare:
+            with ThreadPoolExecutor(max_workers=min(8, len(stocks_to_compare)), thread_name_prefix="score") as executor:
+                technical_summaries = list(executor.map(_score_one, range(1, len(stocks_to_compare) + 1), stocks_to_compare))
         
         stock_to_trade = self.llm_client.get_instrument_to_trade(technical_summaries)
         instrument_to_trades = []
@@ -338,10 +552,29 @@ class TradingAgent:
         else:
             return upstox_client.get_instrument_info_from_stock(NSE_STOCKS[0])
 
+    def _get_pooled_analyzer(self, stock_name):
+        """Returns this symbol's reusable IntradayAnalyzer and the lock serializing its use."""
+        key = (stock_name, self.intraday_technical_config['PERIOD'], self.intraday_technical_config['INTERVAL'])
+        with self._analyzer_pool_lock:
+            entry = self._analyzer_pool.get(key)
+            if entry is None:
+                entry = (IntradayAnalyzer(*key), Lock())
+                self._analyzer_pool[key] = entry
+                if len(self._analyzer_pool) > ANALYZER_POOL_SIZE:
+                    # Only drop the reference: a worker that already holds the evicted analyzer finishes with it
+                    self._analyzer_pool.popitem(last=False)
+            else:
+                self._analyzer_pool.move_to_end(key)
+            return entry
+
     def get_technical_summary(self, stock_name, full_market_data=None):
-        technical_analyzer = IntradayAnalyzer(stock_name, self.intraday_technical_config['PERIOD'], self.intraday_technical_config['INTERVAL'])
-        technical_summary = technical_analyzer.get_intraday_summary()
-        technical_analyzer.cleanup()
+        technical_analyzer, analyzer_lock = self._get_pooled_analyzer(stock_name)
+        with analyzer_lock:
+            if technical_analyzer.refresh() is None:
+                logger.warning("No intraday data for %s; skipping technical analysis", stock_name)
+                technical_summary = {'error': 'No data available'}
+            else:
+                technical_summary = technical_analyzer.get_intraday_summary()
         if full_market_data:
             key = f"NSE_EQ:{stock_name}"
             data_for_stock = full_market_data.get(key, {})
@@ -352,7 +585,7 @@ class TradingAgent:
             technical_summary["total_sell_quantity"] = data_for_stock.get('total_sell_quantity', 0)
             technical_summary["lower_circuit_limit"] = data_for_stock.get('lower_circuit_limit', 0)
             technical_summary["upper_circuit_limit"] = data_for_stock.get('upper_circuit_limit', 0)
-        logger.info(f"Technical summary for {stock_name}: {technical_summary}")
+        logger.debug("Technical summary for %s: %s", stock_name, technical_summary)
         return technical_summary
     
     def get_chart_plot_image_path_for_stock_selection(self, stock_name):
@@ -362,25 +595,87 @@ class TradingAgent:
         chart.destroy()
         return file_name
     
-    def get_chart_plot_image_paths(self, stock_name):
-        image_paths = []
-        for config in DECISION_CHART_PLOT_CONFIG:
-            chart = StockChartAnalyzer(stock_name, config['PERIOD'], config['INTERVAL'])
-            chart.generate_chart()
-            file_name = chart.get_chart_file_name()
-            image_paths.append(file_name)
-            chart.destroy()
-        return image_paths
+    def get_chart_plot_images(self, stock_name):
+        # Data fetch and indicator work overlap across timeframes; only the matplotlib render is serialized
+        with ThreadPoolExecutor(max_workers=len(DECISION_CHART_PLOT_CONFIG), thread_name_prefix="chart") as executor:
+            futures = [executor.submit(self._render_one_chart, stock_name, config) for config in DECISION_CHART_PLOT_CONFIG]
+            return [future.result() for future in futures]
+
+    def _render_one_chart(self, stock_name, config):
+        # Rendered in memory: the PNG goes straight to the LLM, no file write and re-read
+        chart = StockChartAnalyzer(stock_name, config['PERIOD'], config['INTERVAL'])
+        chart.generate_chart(in_memory=True)
+        chart_bytes = chart.get_chart_bytes()
+        chart.destroy()
+        return chart_bytes
     
+    def get_transaction_charges_summary(self, instrument_key, position, market_data, portfolio_margin):
+        """
+        Pre-computes round-trip transaction charges so the LLM gets the final numbers
+        instead of doing the arithmetic itself.
+
+        With an open position the charges are for closing it at the last price; otherwise
+        they are for a round trip of the maximum notional quantity at the current price.
+        """
+        try:
+            open_position = position.get(instrument_key)
+            if open_position:
+                quantity = abs(open_position.quantity)
+                if open_position.quantity > 0:
+                    buy_price, sell_price = open_position.buy_price, open_position.last_price
+                else:
+                    buy_price, sell_price = open_position.last_price, open_position.sell_price
+                trade_desc = f"closing the open position of {quantity} shares at ₹{open_position.last_price}"
+            else:
+                quote = next(iter((market_data or {}).values()), {})
+                price = quote.get('last_price') or 0
+                if not price:
+                    return "N/A"
+                available_margin = (portfolio_margin or {}).get('available_margin') or 0
+                quantity = int(available_margin * self.leverage_on_intraday // price)
+                buy_price = sell_price = price
+                trade_desc = f"a round trip of {quantity} shares (max notional quantity) at ₹{price}"
+
+            charges = self.risk_manager.compute_charges(quantity, buy_price, sell_price)
+            return (
+                f"Computed charges for {trade_desc}: total=₹{charges['total']:.2f} "
+                f"(brokerage=₹{charges['brokerage']:.2f}, STT=₹{charges['stt']:.2f}, "
+                f"transaction=₹{charges['trans_charges']:.2f}, SEBI=₹{charges['sebi_fees']:.2f}, "
+                f"stamp_duty=₹{charges['stamp_duty']:.2f}, GST=₹{charges['gst']:.2f})"
+            )
+        except Exception as e:
+            logger.error("Error computing transaction charges for %s: %s", instrument_key, e)
+            return "N/A"
+
     def save_order_details(self, order_details_dict):
         try:
             # Save Order Details
             self.db.save_order_details(order_details_dict)
         except Exception as e:
-            logger.error(f"Error saving order details: {e}")
+            logger.error("Error saving order details: %s", e)
 
-    def format_previous_decision(self, previous_decisions):
-        readable = "\n\n".join([
+    def format_previous_decision(self, previous_decisions, instrument_key=None):
+        """
+        Formats today's previous decisions for the LLM prompt.
+
+        previous_decisions is a sliding newest-first window, so rows are memoized per
+        instrument by decision time and only rows not seen last cycle are formatted.
+        """
+        cached_rows = self._prev_decision_fmt_cache.get(instrument_key, {})
+        rows = {}
+        for d in previous_decisions:
+            row = cached_rows.get(d['decision_on'])
+            if row is None:
+                row = self._format_decision_row(d)
+            rows[d['decision_on']] = row
+        if instrument_key is not None:
+            # Only the current window is kept, so the memo stays bounded per instrument
+            self._prev_decision_fmt_cache[instrument_key] = rows
+        readable = "\n\n".join(rows.values())
+        return readable
+
+    def _format_decision_row(self, d):
+        return (
             "-------------\n"
             f"Decision Time: {d['decision_on']}\n"
             f"Action: {d['action']}\n"
@@ -388,8 +683,6 @@ class TradingAgent:
             f"Stop Loss: ₹{d.get('stop_loss')}\n"
             f"Take Profit: ₹{d.get('take_profit')}\n"
             f"Thought: {d['thought']}"
-            for d in previous_decisions
-        ])
-        return readable
+        )
 
 
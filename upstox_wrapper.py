@@ -1,18 +1,66 @@
 import upstox_client
-import json
+import ast
+import orjson
 from datetime import datetime
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import gzip
+import os
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
 from logger_config import get_logger
+from schemas import Instrument
 logger = get_logger(__name__)
+# Keep-alive connections per ApiClient; instrument workers share one client per user concurrently
+UPSTOX_CONNECTION_POOL_SIZE = 32
+# The NSE instrument master changes at most once a day; a warm start reads it from disk.
+# Two levels: L1 is the raw download for the day, L2 the filtered/projected frame built from it.
+NSE_INSTRUMENTS_URL = "https://assets.upstox.com/market-quote/instruments/exchange/NSE.json.gz"
+NSE_CACHE_DIR = '.cache/nse'
+# Bump when the filter or the projected columns in fetch_all_nse_instruments change, so old L2 files are ignored
+NSE_INSTRUMENTS_FILTER_VERSION = 'NSE_EQ-EQ-v2'
+NSE_INSTRUMENTS_CACHE_PATH = os.path.join(NSE_CACHE_DIR, f'filtered-{NSE_INSTRUMENTS_FILTER_VERSION}.parquet')
+NSE_INSTRUMENTS_CACHE_TTL_SECONDS = 24 * 60 * 60
+# Which level served each fetch_all_nse_instruments call in this process (l2_hit, l1_hit, network)
+NSE_INSTRUMENTS_CACHE_STATS = Counter()
+# Latest candles kept per intraday fetch (the API returns newest first)
+INTRADAY_CANDLE_COUNT = 10
+# Direct get_intra_day_candle_data callers reuse a fetch for this long
+CANDLE_CACHE_TTL_SECONDS = 30
+# Streamed instruments get their 5-minute candles refreshed in the background on each bar close,
+# offset by a few seconds so the closed bar is available from the History API
+CANDLE_REFRESH_INTERVAL_SECONDS = 5 * 60
+CANDLE_REFRESH_OFFSET_SECONDS = 2
+# Workers for blocking HTTP calls made on behalf of the websocket streams
+STREAM_WORKER_THREADS = 8
+# Brokerage quotes memoized per (instrument, quantity, product, side, price); identical fills repeat often (LRU)
+BROKERAGE_CACHE_SIZE = 1024
+# Raw (non-SDK) HTTPS requests share one session so TCP/TLS connections are reused across calls and clients
+HTTP_TIMEOUT_SECONDS = 10
+_http_session = requests.Session()
+_http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10,
+                                            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504))))
 class UpstoxClient:
     """
     Upstox Client wrapper for trading operations with SDK v2.
 
     Handles authentication, market data subscription, and order placement.
     """
+    __slots__ = (
+        "api_key", "access_token", "client", "market_data_streamer", "portfolio_data_streamer",
+        "subscribed_instruments", "user_profile", "user_funds", "nse_instruments",
+        "_candle_cache", "_candle_cache_lock", "_executor", "_brokerage_cache", "_brokerage_cache_lock",
+        "_candle_refresher", "_candle_refresh_wake", "_candle_refresher_running", "_candle_slot",
+        "_on_market_data", "_on_market_intraday_data", "_update_portfolio_positions", "_save_order_details",
+        "_instrument_records", "_instrument_by_key", "_instrument_by_symbol", "_missing_symbols", "_missing_keys",
+    )
 
     def __init__(self, api_key: str, access_token: str = None,api_secret:str=None,redirect_uri : str = None):
         """
@@ -28,7 +76,32 @@ class UpstoxClient:
         self.market_data_streamer = None
         self.portfolio_data_streamer = None
         self.subscribed_instruments = set()
+        # (instrument_key, unit, interval) -> (monotonic fetch time, candles)
+        self._candle_cache = {}
+        self._candle_cache_lock = threading.Lock()
+        # Streamer callbacks must not block on HTTP; blocking calls they need run here
+        self._executor = ThreadPoolExecutor(max_workers=STREAM_WORKER_THREADS, thread_name_prefix="upstox-stream")
+        # Background candle refresher for subscribed instruments (see _candle_refresh_loop)
+        self._candle_refresher = None
+        self._candle_refresh_wake = threading.Event()
+        self._candle_refresher_running = False
+        # Stream callbacks, set on connect; the streamers call bound methods that forward to them
+        self._on_market_data = None
+        self._on_market_intraday_data = None
+        self._update_portfolio_positions = None
+        self._save_order_details = None
+        # Reused for every frame's candles in on_message (see there)
+        self._candle_slot = {}
+        self._brokerage_cache = OrderedDict()
+        self._brokerage_cache_lock = threading.Lock()
         self.nse_instruments = self.fetch_all_nse_instruments()
+        # Instrument records materialized once; the hash indices below point into them and every lookup goes through these
+        self._instrument_records = self._build_instrument_records(self.nse_instruments)
+        self._instrument_by_key, self._instrument_by_symbol = self._build_instrument_indices(self._instrument_records)
+        # Lookups already known to miss; they return immediately without logging again.
+        # Valid for the instrument master above, so clear them whenever it is reloaded.
+        self._missing_symbols = set()
+        self._missing_keys = set()
         self._initialize_client()
         self.user_profile = None
         self.user_funds = None
@@ -41,6 +114,9 @@ class UpstoxClient:
 
         configuration = upstox_client.Configuration()
         configuration.access_token = self.access_token
+        # The SDK's ApiClient wraps a urllib3 PoolManager; every *Api(self.client) reuses its
+        # pooled keep-alive connections, so size it for the concurrent decision workers
+        configuration.connection_pool_maxsize = UPSTOX_CONNECTION_POOL_SIZE
         self.client = upstox_client.ApiClient(configuration)
         logger.info("Upstox client initialized successfully.")
 
@@ -71,13 +147,15 @@ class UpstoxClient:
         try:
             self.market_data_streamer = upstox_client.MarketDataStreamerV3(self.client)
             self.market_data_streamer.on("open", self.on_open)
-            self.market_data_streamer.on("message", lambda msg: self.on_message(msg, on_market_data, on_market_intraday_data))
+            self._on_market_data = on_market_data
+            self.market_data_streamer.on("message", self._on_market_message)
+            self._start_candle_refresher(on_market_intraday_data)
 
             logger.info("Connecting to market_data_streamer...")
             self.market_data_streamer.connect()
             
         except Exception as e:
-            logger.error(f"Error setting up market_data_streamer: {e}")
+            logger.error("Error setting up market_data_streamer: %s", e)
             raise
 
     def on_open(self):
@@ -89,10 +167,63 @@ class UpstoxClient:
         # Update internal market data state
         # logger.info(f"Received message: {message}")
         if 'feeds' in message:
-            for instrument_key, feed_data in message['feeds'].items():
-                on_market_data(message['feeds'])
-                on_market_intraday_data({instrument_key:self.get_intra_day_candle_data(instrument_key)})
+            feeds = message['feeds']
+            # One callback per frame with every instrument's feed
+            on_market_data(feeds)
+            # Candles are kept current by _candle_refresh_loop; ticks only read the latest stored bars
+            # The slot dict is reused across frames (only the streamer thread gets here), so
+            # on_market_intraday_data must copy out what it keeps rather than hold on to the dict
+            latest_candles = self._candle_slot
+            latest_candles.clear()
+            for instrument_key in feeds:
+                candles = self._get_cached_candles((instrument_key, "minutes", 5), max_age=None)
+                if candles is not None:
+                    latest_candles[instrument_key] = candles
+            if latest_candles:
+                on_market_intraday_data(latest_candles)
+
+    def _on_market_message(self, message):
+        """Market streamer message handler; forwards to on_message with the callbacks from connect."""
+        self.on_message(message, self._on_market_data, self._on_market_intraday_data)
+
+    def _start_candle_refresher(self, on_market_intraday_data):
+        """Starts the background thread that refreshes candles for the subscribed instruments."""
+        self._on_market_intraday_data = on_market_intraday_data
+        if self._candle_refresher and self._candle_refresher.is_alive():
+            return
+        self._candle_refresher_running = True
+        self._candle_refresher = threading.Thread(target=self._candle_refresh_loop, name="upstox-candles", daemon=True)
+        self._candle_refresher.start()
+
+    def _stop_candle_refresher(self):
+        """Signals the candle refresher to exit after its current pass."""
+        self._candle_refresher_running = False
+        self._candle_refresh_wake.set()
 
+    def _candle_refresh_loop(self):
+        """
+        Refreshes 5-minute candles for every subscribed instrument once per bar close, and
+        right away when instruments are subscribed, then hands them to the callback in one call.
+        """
+        while self._candle_refresher_running:
+            self._candle_refresh_wake.clear()
+            instrument_keys = list(self.subscribed_instruments)
+            if instrument_keys:
+                try:
+                    candles = dict(zip(instrument_keys, self._executor.map(self._refresh_candles, instrument_keys)))
+                    self._on_market_intraday_data(candles)
+                except Exception as e:
+                    logger.error("Error refreshing intraday candles for %s: %s", instrument_keys, e)
+            wait = CANDLE_REFRESH_INTERVAL_SECONDS - (time.time() % CANDLE_REFRESH_INTERVAL_SECONDS) + CANDLE_REFRESH_OFFSET_SECONDS
+            self._candle_refresh_wake.wait(timeout=wait)
+
+    def _refresh_candles(self, instrument_key, unit="minutes", interval=5):
+        """Fetches candles bypassing the TTL and stores them in the candle cache."""
+        candles = self._fetch_intra_day_candle_data(instrument_key, unit, interval)
+        if candles is not None:
+            with self._candle_cache_lock:
+                self._candle_cache[(instrument_key, unit, interval)] = (time.monotonic(), candles)
+        return candles
 
     def subscribe(self, instrument_keys, data_type="full"):
         """
@@ -103,16 +234,21 @@ class UpstoxClient:
             data_type (str): The type of data feed ('full' or 'ltpc').
         """
         if self.market_data_streamer:
-            logger.info(f"Subscribing to: {str(instrument_keys)}")
-            self.market_data_streamer.subscribe(instrument_keys, data_type)
+            logger.info("Subscribing to: %s", instrument_keys)
+            # Recorded first: if the socket is not open yet, on_open subscribes them once it is
             self.subscribed_instruments.update(instrument_keys)
+            self._candle_refresh_wake.set() # Load candles for new instruments now, not at the next bar close
+            try:
+                self.market_data_streamer.subscribe(instrument_keys, data_type)
+            except Exception as e:
+                logger.warning("Subscribe deferred until the market_data_streamer opens: %s", e)
         else:
             logger.error("market_data_streamer is not connected. Cannot subscribe.")
             
     def unsubscribe(self, instrument_keys):
         """Unsubscribes from market data for given instruments."""
         if self.market_data_streamer:
-            logger.info(f"Unsubscribing from: {str(instrument_keys)}")
+            logger.info("Unsubscribing from: %s", instrument_keys)
             self.market_data_streamer.unsubscribe(instrument_keys)
             self.subscribed_instruments.difference_update(instrument_keys)
         else:
@@ -162,15 +298,16 @@ class UpstoxClient:
             if resp:
                 order_data = resp.data.to_dict()
                     
-            logger.info(f"Order placed successfully: {order_data}")
+            logger.info("Order placed successfully: %s", order_data)
             return order_data
             
         except Exception as e:
-            logger.error(f"Error placing order: {e}")
+            logger.error("Error placing order: %s", e)
             return None
 
     def disconnect_market_data_streamer(self):
         """Disconnects from the market_data_streamer."""
+        self._stop_candle_refresher()
         if self.market_data_streamer:
             self.market_data_streamer.disconnect()
             logger.info("WebSocket disconnected.")
@@ -184,7 +321,7 @@ class UpstoxClient:
             order_api = upstox_client.OrderApiV3(self.client)
             return order_api.get_order_book()
         except Exception as e:
-            logger.error(f"Error getting order book: {e}")
+            logger.error("Error getting order book: %s", e)
             return None
 
     def get_positions(self):
@@ -196,21 +333,25 @@ class UpstoxClient:
             positions =  portfolio_api.get_positions("2.0")
             if positions:
                 positions_data = positions.data
-                logger.info(f"Positions Data for User : {self.user_profile['user_name']}: \n{positions_data}")
+                logger.debug("Positions Data for User : %s: \n%s", self.user_profile['user_name'], positions_data)
                 return positions_data
             return None
         except Exception as e:
-            logger.error(f"Error getting positions for User : {self.user_profile['user_name']}: {e}")
+            logger.error("Error getting positions for User : %s: %s", self.user_profile['user_name'], e)
             return None
     
     def protfolio_data_streamer_on_message(self, message, update_portfolio_positions, save_order_details):
-        logger.info(f"Portfolio message for User : {self.user_profile['user_name']}: {message}")
-        update_portfolio_positions(self.get_positions())
+        logger.debug("Portfolio message for User : %s: %s", self.user_profile['user_name'], message)
+        # Positions and brokerage are independent round trips; fetch positions on a worker meanwhile
+        positions_future = self._executor.submit(self.get_positions)
 
         try:
-            order_details_dict = json.loads(message.replace("'", '"'))
-            # Get Brokerage For order
-            brokerage_details = self.get_brokerage(order_details_dict["instrument_token"],order_details_dict["quantity"],order_details_dict["product"],order_details_dict["transaction_type"],order_details_dict["average_price"])
+            try:
+                order_details_dict = self._parse_portfolio_message(message)
+                # Get Brokerage For order
+                brokerage_details = self.get_brokerage(order_details_dict["instrument_token"],order_details_dict["quantity"],order_details_dict["product"],order_details_dict["transaction_type"],order_details_dict["average_price"])
+            finally:
+                update_portfolio_positions(positions_future.result())
             if brokerage_details:
                 order_details_dict["total_charges"] = brokerage_details["total"]
                 order_details_dict["brokerage_charges"] = brokerage_details["brokerage"]
@@ -222,16 +363,34 @@ class UpstoxClient:
                 order_details_dict["sebi_turnover"]= brokerage_details['other_taxes']['sebi_turnover']
                 order_details_dict["dp_plan_name"]= brokerage_details['dp_plan']['name']
                 order_details_dict["dp_plan_min_expense"]= brokerage_details['dp_plan']['min_expense']
-            logger.info(f"Order details for User : {self.user_profile['user_name']} for Instrument {order_details_dict['instrument_token']} : {order_details_dict}")
+            logger.info("Order details for User : %s for Instrument %s : %s", self.user_profile['user_name'], order_details_dict['instrument_token'], order_details_dict)
             
             # Save Order Details
             save_order_details(order_details_dict)
         except Exception as e:
-            logger.error(f"Error saving order details for User : {self.user_profile['user_name']}: {e}")
+            logger.error("Error saving order details for User : %s: %s", self.user_profile['user_name'], e)
         
         
+    def _on_portfolio_message(self, message):
+        """Portfolio streamer message handler; forwards to protfolio_data_streamer_on_message with the callbacks from connect."""
+        self.protfolio_data_streamer_on_message(message, self._update_portfolio_positions, self._save_order_details)
+
+    @staticmethod
+    def _parse_portfolio_message(message):
+        """
+        Parses a portfolio stream payload into a dict. Dicts pass through; strings are
+        parsed as JSON, falling back to a Python dict repr (single quotes), which the
+        old quote-replacing hack tried to handle and broke on apostrophes in values.
+        """
+        if isinstance(message, dict):
+            return message
+        try:
+            return orjson.loads(message)
+        except orjson.JSONDecodeError:
+            return ast.literal_eval(message)
+
     def protfolio_data_streamer_on_open(self):
-        logger.info(f"Portfolio Opened for User : {self.user_profile['user_name']}")
+        logger.info("Portfolio Opened for User : %s", self.user_profile['user_name'])
 
     def connect_portofolio_data_streamer(self, update_portfolio_positions, save_order_details):
         """
@@ -246,17 +405,36 @@ class UpstoxClient:
 
         try:
             self.portfolio_data_streamer = upstox_client.PortfolioDataStreamer(self.client)
-            self.portfolio_data_streamer.on("message", lambda msg : self.protfolio_data_streamer_on_message(msg,update_portfolio_positions, save_order_details ))
+            self._update_portfolio_positions = update_portfolio_positions
+            self._save_order_details = save_order_details
+            self.portfolio_data_streamer.on("message", self._on_portfolio_message)
             self.portfolio_data_streamer.on("open", self.protfolio_data_streamer_on_open)
-            logger.info(f"Connecting to portfolio_data_streamer for user : {self.user_profile['user_name']}...")
+            logger.info("Connecting to portfolio_data_streamer for user : %s...", self.user_profile['user_name'])
             self.portfolio_data_streamer.connect()
             
         except Exception as e:
-            logger.error(f"Error setting up portfolio_data_streamer for User : {self.user_profile['user_name']}: {e}")
+            logger.error("Error setting up portfolio_data_streamer for User : %s: %s", self.user_profile['user_name'], e)
             raise
 
     def get_intra_day_candle_data(self, instrument_key, unit :str = "minutes", interval :int = 5):
-        """Gets get_intra_day_candle_data"""
+        """Gets get_intra_day_candle_data, reusing a fetch younger than CANDLE_CACHE_TTL_SECONDS."""
+        key = (instrument_key, unit, interval)
+        candles = self._get_cached_candles(key)
+        if candles is not None:
+            return candles
+
+        return self._refresh_candles(instrument_key, unit, interval)
+
+    def _get_cached_candles(self, key, max_age=CANDLE_CACHE_TTL_SECONDS):
+        """Returns cached candles for (instrument_key, unit, interval) no older than max_age (None: any age), else None."""
+        with self._candle_cache_lock:
+            entry = self._candle_cache.get(key)
+        if entry is not None and (max_age is None or time.monotonic() - entry[0] < max_age):
+            return entry[1]
+        return None
+
+    def _fetch_intra_day_candle_data(self, instrument_key, unit, interval):
+        """Fetches the latest intraday candles from the History API."""
         if not self.client:
             raise ConnectionError("Upstox client not initialized.")
         
@@ -266,9 +444,9 @@ class UpstoxClient:
             if history.data:
                 history_data = history.data.to_dict()
                 history_data_candles = history_data['candles']
-                candles_history_list = []
-                for candle in history_data_candles[:10]:
-                    candle_dict = {
+                # The intraday endpoint takes no date range, so trim here without copying the full day
+                return [
+                    {
                         "timestamp": candle[0],
                         "open": candle[1],
                         "high": candle[2],
@@ -276,14 +454,31 @@ class UpstoxClient:
                         "close": candle[4],
                         "volume": candle[5]
                     }
-                    candles_history_list.append(candle_dict)
-
-                return candles_history_list
+                    for candle in islice(history_data_candles, INTRADAY_CANDLE_COUNT)
+                ]
             return None
         except Exception as e:
-            logger.error(f"Error getting positions for User : {self.user_profile['user_name']}: {e}")
+            logger.error("Error getting positions for User : %s: %s", self.user_profile['user_name'], e)
             return None
     def  get_brokerage(self, instrument_token: str, quantity: int,product:str,transaction_type :str, price: float = 0.0):
+        """Returns the charges breakdown for an order, memoized per identical order parameters."""
+        key = (instrument_token, quantity, product, transaction_type, price)
+        with self._brokerage_cache_lock:
+            charge_data = self._brokerage_cache.get(key)
+            if charge_data is not None:
+                self._brokerage_cache.move_to_end(key)
+                return charge_data
+
+        charge_data = self._fetch_brokerage(instrument_token, quantity, product, transaction_type, price)
+        if charge_data is not None:
+            with self._brokerage_cache_lock:
+                self._brokerage_cache[key] = charge_data
+                if len(self._brokerage_cache) > BROKERAGE_CACHE_SIZE:
+                    self._brokerage_cache.popitem(last=False)
+        return charge_data
+
+    def _fetch_brokerage(self, instrument_token, quantity, product, transaction_type, price):
+        """Fetches the charges breakdown for an order from the Charge API."""
         if not self.client:
             raise ConnectionError("Upstox client not initialized.")
         charge_data = None
@@ -292,10 +487,10 @@ class UpstoxClient:
             charge = charge_api.get_brokerage(instrument_token, quantity,product,transaction_type,price, "2.0")
             if charge:
                 charge_data = charge.data.charges.to_dict()
-                logger.info(f"Brokerage of {instrument_token} for {transaction_type} of Quantity : {quantity} is {charge_data}")
+                logger.debug("Brokerage of %s for %s of Quantity : %s is %s", instrument_token, transaction_type, quantity, charge_data)
             return charge_data
         except Exception as e:
-            logger.error(f"Error getting Brokerage for User : {self.user_profile['user_name']}: {e}")
+            logger.error("Error getting Brokerage for User : %s: %s", self.user_profile['user_name'], e)
             return charge_data
         
     def get_profile(self):
@@ -309,11 +504,11 @@ class UpstoxClient:
                 profile = profile.data.to_dict()
             else:
                 raise Exception("Error getting Profile Data")
-            logger.info(f"================User Profile================ \n{profile}")
+            logger.info("================User Profile================ \n%s", profile)
             self.user_profile = profile
             return profile
         except Exception as e:
-            logger.error(f"Error getting Profile: {e}")
+            logger.error("Error getting Profile: %s", e)
             return None
     
     def get_user_fund_margin(self):
@@ -334,110 +529,190 @@ class UpstoxClient:
                 'span_margin': equity_data.span_margin,
                 'used_margin': equity_data.used_margin
                 }
-                logger.info(f"User Funds And Margins for {self.user_profile['user_name']} : {margin_data}")
+                logger.info("User Funds And Margins for %s : %s", self.user_profile['user_name'], margin_data)
                 self.user_funds = margin_data
                 return margin_data
             return None        
         except Exception as e:
-            logger.error(f"Error getting User Funds And Margins for {self.user_profile['user_name']} : {e}")
+            logger.error("Error getting User Funds And Margins for %s : %s", self.user_profile['user_name'], e)
             return None
 
     def get_instrument_list_from_stocks(self, stocks: list[str]) -> list[str]:
         """
         Given a list of stock names (or partial names), return the matching NSE instrument keys.
         """
-        if self.nse_instruments.empty:
+        if not self._instrument_by_symbol:
             logger.warning("NSE instruments DataFrame is empty!")
             return []
 
-        # Filter for exact match (case-insensitive)
-        result = self.nse_instruments[
-            self.nse_instruments["trading_symbol"].str.upper().isin([s.upper() for s in stocks])
-        ]
-
-        instrument_keys = result["instrument_key"].tolist()
-        logger.info(f"Found instrument_key(s) for User : {self.user_profile['user_name']} for {stocks}: {instrument_keys}")
+        # Exact match (case-insensitive), de-duplicated in input order
+        matches = (self._instrument_by_symbol.get(s.upper()) for s in stocks)
+        instrument_keys = list(dict.fromkeys(m.instrument_key for m in matches if m is not None))
+        logger.info("Found instrument_key(s) for User : %s for %s: %s", self.user_profile['user_name'], stocks, instrument_keys)
         return instrument_keys    
     
     def get_instrument_info_from_stock(self, stock: str) -> dict:
         """
         Given a stock symbol (trading_symbol), return all details of the stock from NSE instruments.
         """
-        if self.nse_instruments.empty:
+        if not self._instrument_by_symbol:
             logger.warning("NSE instruments DataFrame is empty!")
             return {}
 
-        # Filter for exact match (case-insensitive)
-        result = self.nse_instruments[
-            self.nse_instruments["trading_symbol"].str.upper() == stock.upper()
-        ]
-
-        if result.empty:
-            logger.warning(f"No instrument found for stock: {stock}")
+        symbol = stock.upper()
+        if symbol in self._missing_symbols:
+            return {}
+        # Exact match (case-insensitive)
+        instrument_info = self._instrument_by_symbol.get(symbol)
+        if instrument_info is None:
+            logger.warning("No instrument found for stock: %s", stock)
+            self._missing_symbols.add(symbol)
             return {}
-        instrument_info = result.iloc[0].to_dict()
-        logger.info(f"Found instrument info for {stock}: {instrument_info}")
-        # Convert the first (and only) row to dictionary
-        return instrument_info
+        logger.debug("Found instrument info for %s: %s", stock, instrument_info)
+        return instrument_info.to_dict()
 
     def get_instrument_info_from_instrument_key(self, instrument_key: str) -> dict:
         """
         Given a instrument_key, return all details of the instrument_key from NSE instruments.
         """
-        if self.nse_instruments.empty:
+        if not self._instrument_by_key:
             logger.warning("NSE instruments DataFrame is empty!")
             return {}
 
-        # Filter for exact match (case-insensitive)
-        result = self.nse_instruments[
-            self.nse_instruments["instrument_key"] == instrument_key
-        ]
-
-        if result.empty:
-            logger.warning(f"No instrument found for instrument_key: {instrument_key}")
+        if instrument_key in self._missing_keys:
             return None
-        instrument_info = result.iloc[0].to_dict()
-        logger.info(f"Found instrument info for {instrument_key}: {instrument_info}")
-        # Convert the first (and only) row to dictionary
-        return instrument_info
+        instrument_info = self._instrument_by_key.get(instrument_key)
+        if instrument_info is None:
+            logger.warning("No instrument found for instrument_key: %s", instrument_key)
+            self._missing_keys.add(instrument_key)
+            return None
+        logger.debug("Found instrument info for %s: %s", instrument_key, instrument_info)
+        return instrument_info.to_dict()
         
     def get_instrument_key(self, trading_symbol):
-        if(self.nse_instruments.empty == False):
-            result = self.nse_instruments[
-                self.nse_instruments["trading_symbol"] == trading_symbol
-            ]
-            logger.info(f"Found instrument_key for {trading_symbol}: {result}")
-            return result
-        return None
+        """Returns the instrument_key for a trading_symbol (case-insensitive), or None."""
+        instrument_info = self._instrument_by_symbol.get(trading_symbol.upper())
+        if instrument_info is None:
+            return None
+        logger.info("Found instrument_key for %s: %s", trading_symbol, instrument_info.instrument_key)
+        return instrument_info.instrument_key
     def get_instrument_name(self, instrument_key):
-        if(self.nse_instruments.empty == False):
-            result = self.nse_instruments[
-                self.nse_instruments["instrument_key"] == instrument_key
-            ]
-            logger.info(f"Found Instrument name for {instrument_key}: {result}")
-            return result
-        return None
+        """Returns the company name for an instrument_key, or None."""
+        instrument_info = self._instrument_by_key.get(instrument_key)
+        if instrument_info is None:
+            return None
+        logger.info("Found Instrument name for %s: %s", instrument_key, instrument_info.name)
+        return instrument_info.name
+
+    @staticmethod
+    def _build_instrument_records(nse_instruments):
+        """Converts the NSE instruments DataFrame into a list of Instrument records."""
+        if nse_instruments.empty:
+            return []
+        columns = nse_instruments[["instrument_key", "trading_symbol", "name"]]
+        return [Instrument(*row) for row in columns.itertuples(index=False, name=None)]
+
+    @staticmethod
+    def _build_instrument_indices(records):
+        """
+        Builds instrument_key -> record and upper-cased trading_symbol -> record dicts from the
+        NSE instrument records, so lookups are a dict get instead of a scan over every row.
+        The first record wins on duplicate symbols, as the old iloc[0] lookups did.
+        """
+        by_key, by_symbol = {}, {}
+        for row in records:
+            by_key.setdefault(row.instrument_key, row)
+            by_symbol.setdefault(row.trading_symbol.upper(), row)
+        return by_key, by_symbol
+
+    def _load_cached_nse_instruments(self):
+        """Returns the cached NSE instruments DataFrame if it is younger than the TTL, else None."""
+        try:
+            age = time.time() - os.stat(NSE_INSTRUMENTS_CACHE_PATH).st_mtime
+        except OSError:
+            return None
+        if age >= NSE_INSTRUMENTS_CACHE_TTL_SECONDS:
+            return None
+        try:
+            res = pd.read_parquet(NSE_INSTRUMENTS_CACHE_PATH)
+            logger.info("Loaded %s NSE Equity instruments from cache", len(res))
+            return res
+        except Exception as e:
+            logger.warning("Failed to read NSE instruments cache, refetching: %s", e)
+            return None
+
+    def _write_nse_instruments_cache(self, df):
+        """Persists the filtered NSE instruments DataFrame (L2) for the next start."""
+        try:
+            os.makedirs(os.path.dirname(NSE_INSTRUMENTS_CACHE_PATH), exist_ok=True)
+            df.to_parquet(NSE_INSTRUMENTS_CACHE_PATH, index=False)
+        except Exception as e:
+            logger.warning("Failed to write NSE instruments cache: %s", e)
+
+    @staticmethod
+    def _raw_nse_instruments_path():
+        """Path of today's raw instrument download (L1)."""
+        return os.path.join(NSE_CACHE_DIR, f"raw-{datetime.now():%Y%m%d}.json.gz")
+
+    def _download_nse_instruments(self, raw_path):
+        """Streams the gzipped instrument file to raw_path without decompressing or buffering it whole."""
+        os.makedirs(os.path.dirname(raw_path), exist_ok=True)
+        tmp_path = raw_path + ".part"
+        with _http_session.get(NSE_INSTRUMENTS_URL, stream=True, timeout=HTTP_TIMEOUT_SECONDS) as response:
+            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(response.raw, f)
+        os.replace(tmp_path, raw_path) # Never leave a partial file under the L1 name
+        self._prune_raw_nse_instruments(raw_path)
+
+    @staticmethod
+    def _prune_raw_nse_instruments(keep_path):
+        """Removes earlier days' raw downloads; only keep_path is ever read again."""
+        keep_name = os.path.basename(keep_path)
+        try:
+            names = os.listdir(NSE_CACHE_DIR)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith("raw-") and name.endswith(".json.gz") and name != keep_name:
+                try:
+                    os.remove(os.path.join(NSE_CACHE_DIR, name))
+                except OSError:
+                    pass
 
     def fetch_all_nse_instruments(self):
         """
         Fetches the gzipped NSE instrument file from Upstox, unzips it,
         loads the JSON data into a pandas DataFrame, and returns
         selected columns for all instruments within the file.
+
+        Served from the first cache level that has it: the filtered parquet (L2, younger than
+        NSE_INSTRUMENTS_CACHE_TTL_SECONDS), today's raw download (L1), then the network.
         """
-        url = "https://assets.upstox.com/market-quote/instruments/exchange/NSE.json.gz"
+        cached = self._load_cached_nse_instruments()
+        if cached is not None:
+            NSE_INSTRUMENTS_CACHE_STATS['l2_hit'] += 1
+            logger.info("NSE instruments cache: %s", dict(NSE_INSTRUMENTS_CACHE_STATS))
+            return cached
 
+        raw_path = self._raw_nse_instruments_path()
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-
-            # Decompress the gzipped content
-            decompressed_data = gzip.decompress(response.content)
+            if os.path.exists(raw_path):
+                NSE_INSTRUMENTS_CACHE_STATS['l1_hit'] += 1
+            else:
+                NSE_INSTRUMENTS_CACHE_STATS['network'] += 1
+                self._download_nse_instruments(raw_path)
+            logger.info("NSE instruments cache: %s", dict(NSE_INSTRUMENTS_CACHE_STATS))
 
-            # Load JSON data from the decompressed content
-            instruments_data = json.loads(decompressed_data)
+            with gzip.open(raw_path, "rb") as gz:
+                # Load JSON data from the decompressed content
+                instruments_data = orjson.loads(gz.read())
 
-            # Create DataFrame directly from the list of dictionaries
-            df = pd.DataFrame(instruments_data)
+            # Create DataFrame directly from the list of dictionaries, keeping only the
+            # columns used for the filter and the result (the file carries many more)
+            df = pd.DataFrame(instruments_data, columns=["segment", "instrument_type", "instrument_key", "trading_symbol", "name"])
+            # A handful of distinct values: the filter below compares category codes instead of Python strings
+            df = df.astype({"segment": "category", "instrument_type": "category"})
 
             # Filter for NSE Equity instruments specifically, if needed (as per original request)
             # Note: The original request was to get "all NSE instruments", this filter is for "NSE_EQ"
@@ -445,18 +720,29 @@ class UpstoxClient:
             nse_eq_df = df[(df['segment'] == 'NSE_EQ') & (df['instrument_type'] == 'EQ')]
 
             # Return the desired columns for NSE Equity instruments
-            res=  nse_eq_df[["instrument_key", "trading_symbol", "name"]]
-            logger.info(f"Found {len(res)} NSE Equity instruments")
+            res = nse_eq_df[["instrument_key", "trading_symbol", "name"]]
+            try:
+                # Arrow-backed strings for the frame kept on the client; pyarrow is optional
+                res = res.astype("string[pyarrow]")
+            except (ImportError, TypeError) as e:
+                logger.info("pyarrow unavailable, keeping object dtype for instruments: %s", e)
+            logger.info("Found %s NSE Equity instruments", len(res))
+            self._write_nse_instruments_cache(res)
             return res
 
         except requests.exceptions.RequestException as e:
-            logger.info(f"Error fetching the instrument file: {e}")
+            logger.info("Error fetching the instrument file: %s", e)
             return pd.DataFrame() # Return an empty DataFrame on error
-        except json.JSONDecodeError as e:
-            logger.info(f"Error decoding JSON data: {e}")
+        except (orjson.JSONDecodeError, OSError, EOFError) as e:
+            logger.info("Error decoding JSON data: %s", e)
+            # A corrupt L1 file would otherwise be reused all day
+            try:
+                os.remove(raw_path)
+            except OSError:
+                pass
             return pd.DataFrame()
         except KeyError as e:
-            logger.info(f"Missing expected column in instrument data: {e}")
+            logger.info("Missing expected column in instrument data: %s", e)
             return pd.DataFrame()
         
     def exit_all_positions(self):
@@ -464,9 +750,9 @@ class UpstoxClient:
         try:
             api_instance = upstox_client.OrderApi(self.client)
             api_response = api_instance.exit_positions()
-            logger.info(f"Positions exited successfully: {api_response}")
+            logger.info("Positions exited successfully: %s", api_response)
         except Exception as e:
-            logger.error(f"Error exiting positions: {e}")
+            logger.error("Error exiting positions: %s", e)
     def get_last_trading_price(self, symbols, api_version : str = "2.0"):
         if not self.client:
             raise ConnectionError("Upstox client not initialized.")
@@ -480,7 +766,7 @@ class UpstoxClient:
                 raise Exception("Error getting LTP Data")
             return ltp
         except Exception as e:
-            logger.error(f"Error getting LTP: {e}")
+            logger.error("Error getting LTP: %s", e)
             return None
         
 
@@ -495,5 +781,21 @@ class UpstoxClient:
                 return market_quote.to_dict().get('data')
             return {}
         except Exception as e:
-            logger.error(f"Error getting Full market Quote: {e}")
-            return None
\ No newline at end of file
+            logger.error("Error getting Full market Quote: %s", e)
+            return None
+
+    def get_full_market_quote_batch(self, instrument_keys, api_version : str = "2.0"):
+        """
+        Fetches full market quotes for several instruments in one request.
+
+        Returns:
+            dict: instrument_key -> {response_key: quote}, the same shape get_full_market_quote()
+            returns for a single instrument, so callers can use either interchangeably.
+        """
+        if not instrument_keys:
+            return {}
+        data = self.get_full_market_quote(",".join(instrument_keys), api_version) or {}
+        quotes = {}
+        for response_key, quote in data.items():
+            quotes[quote.get('instrument_token')] = {response_key: quote}
+        return quotes
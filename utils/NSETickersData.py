@@ -1,11 +1,28 @@
 import yfinance as yf
 import pandas as pd
+import json
+import math
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from utils.TokenBucket import TokenBucket
+
+# Name/sector/industry/market cap rarely change; keep them on disk instead of calling .info every run
+METADATA_CACHE_PATH = '.cache/nse_ticker_metadata.json'
+METADATA_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+# Per-symbol work in a batch (metadata .info misses) runs on this many threads
+BATCH_WORKERS = 16
+# Yahoo does not publish limits; stay well under what it tolerates before throttling
+YAHOO_REQUESTS_PER_SECOND = 5
+YAHOO_REQUEST_BURST = 10
+
 class NSETickersData:
     def __init__(self):
         self.results = []
+        self._metadata_cache = self._load_metadata_cache()
+        self._rate_limiter = TokenBucket(YAHOO_REQUESTS_PER_SECOND, YAHOO_REQUEST_BURST)
     
     def get_symbols(self):
         """Get your NSE 500 symbols here"""
@@ -31,116 +48,138 @@ class NSETickersData:
             all_results.extend(batch_results)
             
             # Progress update
-            success_count = len([r for r in batch_results if r['LTP'] != 'N/A'])
+            success_count = sum(1 for r in batch_results if not math.isnan(r['LTP']))
             print(f"  ✓ Success: {success_count}/{len(batch)}")
-            
-            # Delay between batches
-            if i + batch_size < len(symbols):
-                time.sleep(1)
         
+        self._save_metadata_cache()
         return all_results
     
     def _process_batch(self, batch_symbols):
-        """Process a single batch of symbols"""
+        """Process a single batch of symbols with one batched price download"""
         try:
-            # Create Tickers object
-            tickers = yf.Tickers(" ".join(batch_symbols))
-            
-            batch_results = []
-            for symbol in batch_symbols:
-                result = self._get_single_stock_data(tickers, symbol)
-                batch_results.append(result)
-            
-            return batch_results
-            
+            # Two daily bars per symbol give the last price and the previous close
+            self._rate_limiter.acquire()
+            history = yf.download(batch_symbols, period='2d', group_by='ticker', threads=True, progress=False, auto_adjust=False)
         except Exception as e:
             print(f"  ✗ Batch error: {e}")
             # Fallback to individual processing
             return [self._get_individual_fallback(symbol) for symbol in batch_symbols]
+
+        # Symbols with cached metadata return immediately; misses wait on Yahoo concurrently
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+            return list(pool.map(lambda symbol: self._get_single_stock_data(history, symbol), batch_symbols))
     
-    def _get_single_stock_data(self, tickers, symbol):
-        """Get data for single stock from Tickers object"""
+    def _get_single_stock_data(self, history, symbol):
+        """Get data for single stock from the batched history, plus cached metadata"""
         try:
             base_symbol = symbol.replace('.NS', '')
-            ticker = tickers.tickers[symbol]
-            info = ticker.info
-            print(info)
-            
+            bars = history[symbol] if isinstance(history.columns, pd.MultiIndex) else history
+            bars = bars.dropna(subset=['Close'])
+            if bars.empty:
+                # No history for this symbol; .info is the only other source
+                return self._get_individual_fallback(symbol)
+
             # Get price data
-            ltp = (info.get('currentPrice') or 
-                  info.get('regularMarketPrice') or 
-                  info.get('previousClose'))
+            ltp = float(bars['Close'].iloc[-1])
+            prev_close = float(bars['Close'].iloc[-2]) if len(bars) > 1 else math.nan
             
-            # Calculate change
-            prev_close = info.get('previousClose', 0)
-            if ltp and prev_close and ltp != 'N/A' and prev_close != 'N/A':
-                change = ltp - prev_close
-                change_pct = (change / prev_close) * 100
-            else:
-                change = 'N/A'
-                change_pct = 'N/A'
-            
-            # Get additional data
-            volume = info.get('volume', 'N/A')
-            market_cap = info.get('marketCap', 'N/A')
+            # Calculate change (NaN propagates when the previous close is missing)
+            change = ltp - prev_close
+            change_pct = (change / prev_close) * 100 if prev_close else math.nan
             
+            info = self._get_metadata(symbol)
             return {
-                'symbol': base_symbol,
+                'Symbol': base_symbol,
                 'Company_Name': info.get('longName', base_symbol),
-                'last_price': ltp if ltp else 0.0,
+                'LTP': ltp,
                 'Previous_Close': prev_close,
                 'Change': change,
                 'Change_Percent': change_pct,
-                'Volume': volume,
-                'Market_Cap': market_cap,
-                'Sector': info.get('sector', 'N/A'),
-                'Industry': info.get('industry', 'N/A'),
+                'Volume': float(bars['Volume'].iloc[-1]),
+                'Market_Cap': info.get('marketCap', math.nan),
+                'Sector': info.get('sector'),
+                'Industry': info.get('industry'),
                 'Error': None
             }
             
         except Exception as e:
             return self._get_individual_fallback(symbol)
+
+    def _get_metadata(self, symbol):
+        """Name/sector/industry/market cap for a symbol, from the disk cache or .info on a miss"""
+        entry = self._metadata_cache.get(symbol)
+        if entry and time.time() - entry['fetched_at'] < METADATA_CACHE_TTL_SECONDS:
+            return entry
+        try:
+            self._rate_limiter.acquire()
+            info = yf.Ticker(symbol).info
+        except Exception as e:
+            print(f"  ✗ Metadata error for {symbol}: {e}")
+            return entry or {}
+        entry = {key: info[key] for key in ('longName', 'marketCap', 'sector', 'industry') if key in info}
+        entry['fetched_at'] = time.time()
+        self._metadata_cache[symbol] = entry
+        return entry
+
+    def _load_metadata_cache(self):
+        """Load the persisted metadata cache, or start empty"""
+        try:
+            with open(METADATA_CACHE_PATH) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_metadata_cache(self):
+        """Persist the metadata cache for the next run"""
+        try:
+            os.makedirs(os.path.dirname(METADATA_CACHE_PATH), exist_ok=True)
+            with open(METADATA_CACHE_PATH, 'w') as f:
+                json.dump(self._metadata_cache, f)
+        except OSError as e:
+            print(f"  ✗ Failed to write metadata cache: {e}")
     
     def _get_individual_fallback(self, symbol):
         """Fallback method for individual stock fetch"""
         try:
             stock = yf.Ticker(symbol)
+            self._rate_limiter.acquire()
             info = stock.info
             
             ltp = info.get('currentPrice') or info.get('regularMarketPrice')
-            prev_close = info.get('previousClose', 'N/A')
+            prev_close = info.get('previousClose', math.nan)
             
             return {
                 'Symbol': symbol.replace('.NS', ''),
                 'Company_Name': info.get('longName', symbol.replace('.NS', '')),
-                'LTP': ltp if ltp else 'N/A',
+                'LTP': ltp if ltp else math.nan,
                 'Previous_Close': prev_close,
-                'Change': 'N/A',
-                'Change_Percent': 'N/A',
-                'Volume': info.get('volume', 'N/A'),
-                'Market_Cap': info.get('marketCap', 'N/A'),
-                'Sector': info.get('sector', 'N/A'),
-                'Industry': info.get('industry', 'N/A'),
+                'Change': math.nan,
+                'Change_Percent': math.nan,
+                'Volume': info.get('volume', math.nan),
+                'Market_Cap': info.get('marketCap', math.nan),
+                'Sector': info.get('sector'),
+                'Industry': info.get('industry'),
                 'Error': 'Individual fetch'
             }
         except Exception as e:
             return {
                 'Symbol': symbol.replace('.NS', ''),
-                'Company_Name': 'N/A',
-                'LTP': 'N/A',
-                'Previous_Close': 'N/A',
-                'Change': 'N/A',
-                'Change_Percent': 'N/A',
-                'Volume': 'N/A',
-                'Market_Cap': 'N/A',
-                'Sector': 'N/A',
-                'Industry': 'N/A',
+                'Company_Name': None,
+                'LTP': math.nan,
+                'Previous_Close': math.nan,
+                'Change': math.nan,
+                'Change_Percent': math.nan,
+                'Volume': math.nan,
+                'Market_Cap': math.nan,
+                'Sector': None,
+                'Industry': None,
                 'Error': str(e)
             }
     
     def generate_report(self, df):
         """Generate summary report"""
-        successful = len(df[df['LTP'] != 'N/A'])
+        # Missing values are NaN, so the numeric columns stay float64 end to end
+        successful = int(df['LTP'].notna().sum())
         total = len(df)
         
         print("\n" + "="*70)
@@ -154,21 +193,17 @@ class NSETickersData:
         
         # Top gainers (if data available)
         if successful > 0:
-            valid_data = df[df['Change_Percent'] != 'N/A'].copy()
+            valid_data = df.dropna(subset=['Change_Percent'])
             if len(valid_data) > 0:
-                valid_data['Change_Percent'] = pd.to_numeric(valid_data['Change_Percent'], errors='coerce')
-                valid_data = valid_data.dropna(subset=['Change_Percent'])
+                print(f"\nTop 5 Gainers:")
+                top_gainers = valid_data.nlargest(5, 'Change_Percent')
+                for _, row in top_gainers.iterrows():
+                    print(f"  {row['Symbol']}: +{row['Change_Percent']:.2f}%")
                 
-                if len(valid_data) > 0:
-                    print(f"\nTop 5 Gainers:")
-                    top_gainers = valid_data.nlargest(5, 'Change_Percent')
-                    for _, row in top_gainers.iterrows():
-                        print(f"  {row['Symbol']}: +{row['Change_Percent']:.2f}%")
-                    
-                    print(f"\nTop 5 Losers:")
-                    top_losers = valid_data.nsmallest(5, 'Change_Percent')
-                    for _, row in top_losers.iterrows():
-                        print(f"  {row['Symbol']}: {row['Change_Percent']:.2f}%")
+                print(f"\nTop 5 Losers:")
+                top_losers = valid_data.nsmallest(5, 'Change_Percent')
+                for _, row in top_losers.iterrows():
+                    print(f"  {row['Symbol']}: {row['Change_Percent']:.2f}%")
 
 # Usage
 if __name__ == "__main__":
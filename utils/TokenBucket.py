@@ -0,0 +1,37 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`; acquire()
+    blocks only as long as needed for the next token, so bursts up to `capacity`
+    go through immediately and sustained traffic is paced at `rate`.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate (float): Tokens added per second (sustained requests per second).
+            capacity (int): Maximum burst size.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1):
+        """Blocks until `tokens` tokens are available, then consumes them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)